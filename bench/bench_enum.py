@@ -0,0 +1,72 @@
+#! python 3
+# -*- coding: utf_8 -*-
+"""枚举列的转换速度：很大的枚举，几万个单元格
+
+python bench/bench_enum.py
+python bench/bench_enum.py --root 旧版本的目录    # 和旧版本比较，结果的md5相同时转换结果一样
+"""
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+from enum import Enum as CreateEnum
+
+
+def create_enum(tp, member_count):
+    # 和code.Enum.add_fields一样通过CreateEnum创建，中间插入一个别名(值重复的成员)
+    members = [(f'Buff{i}', i * 3) for i in range(1, member_count + 1)]
+    members.insert(5, ('Alias', 30))
+    return tp.Enum('EBuff', CreateEnum('EBuff', members), None), members
+
+
+def create_cells(members, cell_count):
+    # 名字、float和字符串形式的值，还有少量空单元格
+    names = [name for name, _ in members]
+    cells = []
+    for _ in range(cell_count):
+        r = random.random()
+        if r < 0.4:
+            cells.append(random.choice(names))
+        elif r < 0.8:
+            cells.append(float(random.choice(members)[1]))
+        elif r < 0.95:
+            cells.append(str(random.choice(members)[1]))
+        else:
+            cells.append(None)
+    return cells
+
+
+def run():
+    parser = argparse.ArgumentParser(description='benchmark enum convert')
+    parser.add_argument('--root', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='excel_convert directory to import, default is this one')
+    parser.add_argument('--members', type=int, default=2000, help='member count of the enum')
+    parser.add_argument('--cells', type=int, default=20000, help='cell count to convert')
+    parser.add_argument('--seed', type=int, default=7)
+    opts = parser.parse_args()
+
+    sys.path.insert(0, opts.root)
+    import core.type as tp
+
+    random.seed(opts.seed)
+    enum_type, members = create_enum(tp, opts.members)
+    cells = create_cells(members, opts.cells)
+
+    results = []
+    start = time.perf_counter()
+    for cell in cells:
+        try:
+            results.append(enum_type.convert(cell))
+        except Exception as e:
+            results.append(str(e))
+    elapsed = time.perf_counter() - start
+
+    print(f'root: {opts.root}')
+    print(f'enum members {opts.members}, cells {opts.cells}: {elapsed:.3f}s')
+    print(f'results md5: {hashlib.md5(repr(results).encode()).hexdigest()}')
+
+
+if __name__ == '__main__':
+    run()
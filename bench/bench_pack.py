@@ -0,0 +1,104 @@
+#! python 3
+# -*- coding: utf_8 -*-
+"""容器和结构体的转换和打包速度：类似技能效果表，list<struct>、map、LI、LF和struct列
+
+python bench/bench_pack.py
+python bench/bench_pack.py --root 旧版本的目录    # 和旧版本比较，打包结果的md5相同时数据一样
+"""
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+
+
+def create_types(tp, parser):
+    # 定长字段的结构体和包含字符串的结构体
+    tp.Struct('SBenchEffect', [('Id', 'I', 1), ('Value', 'I', 2), ('Rate', 'F', 3)])
+    tp.Struct('SBenchInfo', [('Name', 'S', 1), ('Level', 'I', 2)])
+    names = ['list<SBenchEffect>', 'map<I,I>', 'map<I,SBenchEffect>', 'LI', 'LF', 'SBenchEffect', 'SBenchInfo']
+    return [parser.parse_str(name) for name in names]
+
+
+def effect_cell():
+    return f'{{{random.randint(1, 50000)},{random.randint(-100, 100)},{random.randint(0, 100) / 4}}}'
+
+
+def create_row():
+    count = random.randint(1, 6)
+    return [
+        '[' + ','.join(effect_cell() for _ in range(count)) + ']',
+        ','.join(f'{random.randint(1, 200)}:{random.randint(0, 10000)}' for _ in range(count)),
+        '{' + ','.join(f'{i}:{effect_cell()}' for i in range(count)) + '}',
+        ','.join(str(random.randint(1, 99999)) for _ in range(random.randint(1, 20))),
+        ','.join(str(random.randint(0, 400) / 8) for _ in range(random.randint(1, 10))),
+        effect_cell(),
+        f'skill_{random.randint(1, 9999)},{random.randint(1, 99)}',
+    ]
+
+
+def best_of(repeat, function):
+    best = None
+    result = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run():
+    parser = argparse.ArgumentParser(description='benchmark container convert and pack')
+    parser.add_argument('--root', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='excel_convert directory to import, default is this one')
+    parser.add_argument('--rows', type=int, default=4000, help='row count of the sheet')
+    parser.add_argument('--repeat', type=int, default=3, help='run each step several times, print the best time')
+    parser.add_argument('--seed', type=int, default=7)
+    opts = parser.parse_args()
+
+    sys.path.insert(0, opts.root)
+    import core.type as tp
+    from core.parser import TypeParser
+
+    # 不使用转换缓存，每个单元格都重新转换和打包
+    tp.ConvertCacheSize = 0
+    tp.StringEncodingOfPack = 'gbk'
+
+    random.seed(opts.seed)
+    types = create_types(tp, TypeParser)
+    rows = [create_row() for _ in range(opts.rows)]
+
+    def convert_rows():
+        values = []
+        for row in rows:
+            row_values = []
+            for handler, cell in zip(types, row):
+                ok, value = handler.convert(cell)
+                if not ok:
+                    raise Exception(f'convert {cell} to {handler.name} failed')
+                row_values.append(value)
+            values.append(row_values)
+        return values
+
+    def pack_rows():
+        packed = []
+        for row_values in values:
+            for handler, value in zip(types, row_values):
+                packed.append(handler.pack(value))
+        return b''.join(packed)
+
+    print(f'root: {opts.root}')
+    elapsed, values = best_of(opts.repeat, convert_rows)
+    print(f'convert {opts.rows} rows: {elapsed:.3f}s')
+
+    for pack_ttype in (False, True):
+        tp.PackTType = pack_ttype
+        elapsed, packed = best_of(opts.repeat, pack_rows)
+        print(f'pack {opts.rows} rows, thrift {pack_ttype}: {elapsed:.3f}s, md5 {hashlib.md5(packed).hexdigest()}')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,90 @@
+# python 3
+# -*- coding: utf_8 -*-
+
+import os
+import hashlib
+import pickle
+
+
+def get_file_hash(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+class BookCache:
+    _Version = 1
+
+    def __init__(self, cache_dir):
+        self._cache_dir = os.path.join(cache_dir, 'books')
+        self.hit_count = 0
+        self.miss_count = 0
+
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+    def _get_cache_file(self, file_path):
+        key = hashlib.md5(os.path.abspath(file_path).encode('utf-8')).hexdigest()
+        return os.path.join(self._cache_dir, f'{key}.pickle')
+
+    @staticmethod
+    def _read_entry(cache_file):
+        if not os.path.exists(cache_file):
+            return None
+
+        try:
+            with open(cache_file, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f'--- warning invalid cache file {cache_file}, {e}')
+            return None
+
+    @staticmethod
+    def _write_entry(cache_file, entry):
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+
+    def get(self, file_path):
+        cache_file = self._get_cache_file(file_path)
+        entry = self._read_entry(cache_file)
+        sheets = self._check_entry(cache_file, entry, file_path)
+        if sheets is None:
+            self.miss_count += 1
+        else:
+            self.hit_count += 1
+
+        return sheets
+
+    def _check_entry(self, cache_file, entry, file_path):
+        if not entry or entry['version'] != BookCache._Version:
+            return None
+
+        if entry['path'] != os.path.abspath(file_path):
+            return None
+
+        stat = os.stat(file_path)
+        if entry['size'] != stat.st_size:
+            return None
+
+        # 修改时间不同时(例如重新checkout)，内容相同依然可以使用缓存
+        if entry['mtime'] != stat.st_mtime_ns:
+            if entry['hash'] != get_file_hash(file_path):
+                return None
+
+            entry['mtime'] = stat.st_mtime_ns
+            self._write_entry(cache_file, entry)
+
+        return entry['sheets']
+
+    def put(self, file_path, sheets):
+        stat = os.stat(file_path)
+        entry = {
+            'version': BookCache._Version,
+            'path': os.path.abspath(file_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': get_file_hash(file_path),
+            'sheets': sheets
+        }
+        self._write_entry(self._get_cache_file(file_path), entry)
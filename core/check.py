@@ -2,6 +2,8 @@
 # -*- coding: utf_8 -*-
 
 import re
+import ast
+import copy
 
 
 class CheckBase:
@@ -33,6 +35,12 @@ class _RangePair:
 
         return True
 
+    def check_array(self, values):
+        # values 是numpy数组，返回每个值是否在范围内
+        lower = values >= self.min if self.contain_min else values > self.min
+        upper = values <= self.max if self.contain_max else values < self.max
+        return lower & upper
+
 
 class Range(CheckBase):
     _range_re = re.compile(r'\s*([\[\(])(\d+)\s*,\s*(\d+)([\]\)])', re.S)
@@ -71,30 +79,155 @@ class Range(CheckBase):
 
         return False
 
+    def check_bounds(self, min_val, max_val):
+        # 两端在同一个range中，中间的值也都在这个range中
+        for range_pair in self._list:
+            if range_pair.check(min_val) and range_pair.check(max_val):
+                return True
+
+        return False
+
+    def check_array(self, values):
+        mask = None
+        for range_pair in self._list:
+            pair_mask = range_pair.check_array(values)
+            mask = pair_mask if mask is None else mask | pair_mask
+
+        return mask
+
     def __str__(self):
         return self._range_str
 
 
 class Index(CheckBase):
+    # Sheet.Field.member，Field为空时使用表的主键，member是结构体的字段名或者map的key/value
     def __init__(self, index_str):
-        pass
+        names = [name.strip() for name in index_str.split('.')] if index_str else []
+        if len(names) == 0 or len(names) > 3 or '' in names:
+            raise Exception(f'invalid index str {index_str}')
+
+        self._index_str = index_str
+        self.sheet_name = names[0]
+        self.field_name = names[1] if len(names) > 1 else None
+        self.member = names[2] if len(names) > 2 else None
+        self._values = None
+
+    @property
+    def is_built(self):
+        return self._values is not None
+
+    def set_values(self, values):
+        # values 是被引用的列中所有值的set，同一列的索引只创建一次
+        self._values = values
 
     def check(self, val):
-        pass
+        # 索引没有创建时(被引用的表没有加载)不检查
+        if self._values is None:
+            return True
+
+        try:
+            return val in self._values
+        except TypeError:
+            return False
+
+    def __str__(self):
+        return self._index_str
+
+
+class _EvalNames(ast.NodeTransformer):
+    # 把字段名替换为按下标读取这一行的值
+    def __init__(self, name_indexes, local_names):
+        self._name_indexes = name_indexes
+        self._local_names = local_names
+
+    def visit_Name(self, node):
+        if node.id in self._local_names or node.id in Eval.functions:
+            return node
+
+        if node.id not in self._name_indexes:
+            raise Exception(f'unknown name {node.id}')
+
+        index_node = ast.parse(f'_values[{self._name_indexes[node.id]}]', mode='eval').body
+        return ast.copy_location(index_node, node)
 
 
 class Eval(CheckBase):
+    # 表达式中可以使用的函数
+    functions = {f.__name__: f for f in [abs, all, any, bool, float, int, len, list, max, min, range, round, set,
+                                         sorted, str, sum, tuple]}
+
+    _node_types = (ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.IfExp, ast.Call, ast.keyword,
+                   ast.Name, ast.Constant, ast.Subscript, ast.Slice, ast.List, ast.Tuple, ast.Set, ast.Dict,
+                   ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.comprehension,
+                   ast.boolop, ast.operator, ast.unaryop, ast.cmpop, ast.expr_context)
+
     def __init__(self, eval_str):
-        pass
+        self._eval_str = eval_str
+        self._func = None
+
+        try:
+            self._tree = ast.parse(eval_str.strip(), mode='eval')
+        except SyntaxError as e:
+            raise Exception(f'invalid eval str {eval_str}, {e.msg}')
+
+        self._local_names = set()
+        for node in ast.walk(self._tree):
+            if not isinstance(node, Eval._node_types):
+                raise Exception(f'invalid eval str {eval_str}, not support {type(node).__name__}')
+
+            if isinstance(node, ast.comprehension):
+                for target in ast.walk(node.target):
+                    if isinstance(target, ast.Name):
+                        self._local_names.add(target.id)
+
+    @property
+    def names(self):
+        # 表达式中引用的字段名
+        return {node.id for node in ast.walk(self._tree) if isinstance(node, ast.Name)
+                and node.id not in self._local_names and node.id not in Eval.functions}
+
+    def compile(self, names):
+        # names 是这一行的值对应的字段名，编译后check直接按下标读取值
+        # NodeTransformer会修改传入的语法树，每次编译使用副本，同一个表达式可以再次编译
+        name_indexes = {name: i for i, name in enumerate(names)}
+        try:
+            body = _EvalNames(name_indexes, self._local_names).visit(copy.deepcopy(self._tree)).body
+        except Exception as e:
+            raise Exception(f'invalid eval str {self._eval_str}, {e}')
+
+        args = ast.arguments(posonlyargs=[], args=[ast.arg(arg='_values')], kwonlyargs=[], kw_defaults=[],
+                             defaults=[])
+        func_tree = ast.fix_missing_locations(ast.Expression(body=ast.Lambda(args=args, body=body)))
+        code = compile(func_tree, f'<eval {self._eval_str}>', 'eval')
+        self._func = eval(code, {'__builtins__': {}, **Eval.functions})
+
+    def check(self, values):
+        return bool(self._func(values))
 
-    def check(self, val):
-        pass
+    def __str__(self):
+        return self._eval_str
 
 
 class CheckSetting:
     def __init__(self):
         self._val_range = None
         self._len_range = None
+        self._index = None
+        self._eval = None
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def eval(self):
+        return self._eval
+
+    def set_eval(self, eval_str):
+        self._eval = Eval(eval_str)
+
+    def set_index(self, index_str):
+        self._index = Index(index_str)
 
     def set_range(self, range_str):
         self._val_range = Range(range_str)
@@ -108,6 +241,18 @@ class CheckSetting:
 
         return True
 
+    def check_range_bounds(self, min_val, max_val):
+        if self._val_range:
+            return self._val_range.check_bounds(min_val, max_val)
+
+        return True
+
+    def check_range_array(self, values):
+        if self._val_range:
+            return self._val_range.check_array(values)
+
+        return None
+
     def check_len_range(self, val):
         if self._len_range:
             return self._len_range.check(val)
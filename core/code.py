@@ -1,8 +1,10 @@
 #! python 3
 # -*- coding: utf_8 -*-
 
+import struct
 from enum import Enum as CreateEnum
 from . import type
+from . import numeric
 from .check import *
 from . utils import *
 
@@ -30,6 +32,11 @@ class CodeTypeMap:
         else:
             self._structs[code_type.name] = code_type
 
+    def clear(self):
+        self._type_map.clear()
+        self._enums.clear()
+        self._structs.clear()
+
     @property
     def enums(self):
         return self._enums
@@ -109,6 +116,18 @@ class FieldDataType:
     def reader(self):
         return self._reader
 
+    @property
+    def handler(self):
+        return self._handle
+
+    @property
+    def ttype(self):
+        return self._handle.ttype
+
+    @property
+    def pack_format(self):
+        return self._handle.pack_format if self._handle else None
+
     def convert(self, data):
         return self._handle.convert(data)
 
@@ -148,9 +167,6 @@ class StructField(BaseField):
         self._ignore = 'ignore' in props or not is_valid_language(languages)
         self._check_setting = CheckSetting()
 
-        # data
-        self._target = None
-
         # 二次处理
         for key, val in self._props.items():
             self._process_prop(key, val)
@@ -192,14 +208,18 @@ class StructField(BaseField):
         return self._only_define
 
     @property
-    def value_data(self):
-        return self._target
+    def check_setting(self):
+        return self._check_setting
 
     def _process_prop(self, key, val):
         if key == 'range':
             self._check_setting.set_range(val)
         elif key == 'len_range':
             self._check_setting.set_len_range(val)
+        elif key == 'index':
+            self._check_setting.set_index(val)
+        elif key == 'eval':
+            self._check_setting.set_eval(val)
         elif key == 'language':
             if not self._ignore:
                 self._ignore = not is_valid_language(val)
@@ -212,27 +232,119 @@ class StructField(BaseField):
     def _check(self, dat):
         return self.type.check(dat, self._check_setting)
 
-    def _pack(self, dat):
-        return self.type.pack(dat)
-
-    def set_data(self, data):
+    def convert_data(self, data):
+        # 转换并检查数据，不修改字段，返回 (ok, info, target)
         try:
-            ok, self._target = self._convert(data)
+            ok, target = self._convert(data)
 
             if not ok:
-                return False, f'{self.info} convert to {self.type} failed, data {data}'
+                return False, f'{self.info} convert to {self.type} failed, data {data}', target
         except Exception as e:
-            return False, f'{self.info} convert to {self.type} failed, data {data}, {e}'
+            return False, f'{self.info} convert to {self.type} failed, data {data}, {e}', None
 
-        ok, info = self._check(self._target)
+        ok, info = self._check(target)
         if not ok:
-            return False, f'{self.info} check failed, {info}, data {data}, target {self._target}'
+            return False, f'{self.info} check failed, {info}, data {data}, target {target}', target
+
+        return True, '', target
+
+    def index_values(self, target):
+        # 需要在索引中检查的值，容器和结构体中的元素也会检查
+        index = self._check_setting.index
+        if not index:
+            return []
+
+        return self.type.handler.index_values(target, index.member)
+
+
+class RowData:
+    """转换好的一行数据，values和写入的字段一一对应，创建后不再修改"""
+    __slots__ = ('_values', '_key')
+
+    def __init__(self, values, key):
+        self._values = tuple(values)
+        self._key = key
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def key(self):
+        return self._key
+
+
+class RowPacker:
+    """按字段顺序打包一行数据，连续的定长字段使用一个预编译的struct.Struct打包"""
+
+    def __init__(self, fields, pack_ttype):
+        self._pack_ttype = pack_ttype
+        self._steps = []
+        self._runs = []  # (step index, 定长字段)
+        self._run_rows = {}  # step index -> numpy打包好的 (每行字节数, 数据)
+
+        run_start = 0
+        for i, field in enumerate(fields):
+            if field.type.pack_format:
+                continue
 
-        return True, ''
+            self._add_fixed_step(fields, run_start, i, pack_ttype)
+            run_start = i + 1
+            self._add_field_step(field, i)
+
+        self._add_fixed_step(fields, run_start, len(fields), pack_ttype)
+
+    def _add_fixed_step(self, fields, start, end, pack_ttype):
+        # fields[start:end] 都是定长字段，打包时取这一行中对应的值
+        if start == end:
+            return
+
+        run_fields = fields[start:end]
+        self._runs.append((len(self._steps), run_fields))
+
+        if not pack_ttype:
+            pack = struct.Struct('<' + ''.join([f.type.pack_format for f in run_fields])).pack
+            self._steps.append(lambda values: pack(*values[start:end]))
+            return
+
+        # 每个字段前面是 ttype(int8) 和 position(int16)，值填入每三个参数中的最后一个
+        pack = struct.Struct('<' + ''.join([f'bh{f.type.pack_format}' for f in run_fields])).pack
+        args = []
+        for f in run_fields:
+            args.extend([f.type.ttype.value, f.position, None])
+
+        def pack_fields(values):
+            args[2::3] = values[start:end]
+            return pack(*args)
+
+        self._steps.append(pack_fields)
+
+    def _add_field_step(self, field, index):
+        self._steps.append(lambda values: field.type.pack(values[index]))
+
+    def set_numeric_columns(self, numeric_columns):
+        # 全部由numpy转换的定长字段，直接使用按行打包好的数据
+        self._run_rows = {}
+        for step_index, fields in self._runs:
+            columns = [numeric_columns.get(f, None) for f in fields]
+            if all(columns):
+                self._run_rows[step_index] = numeric.pack_rows(fields, columns, self._pack_ttype)
+
+    def pack(self, values, row_index=None):
+        # values 是RowData.values，和创建时的字段一一对应
+        if row_index is None or not self._run_rows:
+            return b''.join([step(values) for step in self._steps])
+
+        row_bytes = []
+        for step_index, step in enumerate(self._steps):
+            run_rows = self._run_rows.get(step_index, None)
+            if run_rows:
+                size, data = run_rows
+                row_bytes.append(data[row_index * size:(row_index + 1) * size])
+            else:
+                row_bytes.append(step(values))
 
-    def pack_data(self, stream):
-        bin_bytes = self._pack(self._target)
-        stream.write(bin_bytes)
+        return b''.join(row_bytes)
 
 
 class BaseType:
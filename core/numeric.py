@@ -0,0 +1,100 @@
+#! python 3
+# -*- coding: utf_8 -*-
+
+from . import type as tp
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 使用numpy按列转换、检查数值字段，需要安装numpy
+UseNumpy = False
+
+_numeric_types = {int, float, bool, type(None)}
+_dtypes = {'?': '?', 'i': '<i4', 'f': '<f4'}
+
+
+def is_available():
+    return np is not None
+
+
+def is_numeric_handler(handler):
+    # Int8、Int16打包时还有范围限制，Enum需要按名字转换，这些类型仍然逐个转换
+    return type(handler) in (tp.Int, tp.Float, tp.Bool)
+
+
+class NumericColumn:
+    def __init__(self, values, array):
+        self.values = values  # 转换后的值，转换或者检查失败的行为None
+        self.array = array
+
+
+def _convert_array(handler, check_setting, data):
+    # 返回 (numpy数组, 失败的行)，失败的行由逐个转换的代码给出错误信息
+    if isinstance(handler, tp.Bool):
+        return data != 0, None
+
+    if isinstance(handler, tp.Int):
+        data = np.trunc(data)
+        bad = (data > 2147483647) | (data < -2147483648)
+        data = np.where(bad, 0, data).astype(_dtypes['i'])
+    else:
+        # 超出float范围的值打包时会报错
+        with np.errstate(over='ignore'):
+            bad = np.isinf(data.astype(_dtypes['f']))
+        data = np.where(bad, 0, data)
+
+    range_mask = check_setting.check_range_array(data)
+    if range_mask is not None:
+        bad |= ~range_mask
+
+    return data, bad
+
+
+def convert_column(handler, check_setting, values):
+    if not set(map(type, values)) <= _numeric_types:
+        return None
+
+    # None 转换为 nan，和逐个转换一样使用默认值 0
+    data = np.array(values, dtype=np.float64)
+    data[np.isnan(data)] = 0
+    data, bad = _convert_array(handler, check_setting, data)
+
+    values = data.tolist()
+    if bad is not None and bad.any():
+        for i in np.flatnonzero(bad).tolist():
+            values[i] = None
+
+    return NumericColumn(values, data)
+
+
+def convert_columns(fields, cell2d):
+    columns = {}
+    for field in fields:
+        if not is_numeric_handler(field.type.handler):
+            continue
+
+        column = convert_column(field.type.handler, field.check_setting, cell2d.columns[field.column_index])
+        if column:
+            columns[field] = column
+
+    return columns
+
+
+def pack_rows(fields, columns, pack_ttype):
+    # 定长字段按行打包成一段数据，返回 (每行的字节数, 所有行的数据)
+    dtype = []
+    for j, field in enumerate(fields):
+        if pack_ttype:
+            dtype.extend([(f't{j}', 'i1'), (f'p{j}', '<i2')])
+        dtype.append((f'v{j}', _dtypes[field.type.pack_format]))
+
+    rows = np.zeros(len(columns[0].array), dtype=dtype)
+    for j, field in enumerate(fields):
+        if pack_ttype:
+            rows[f't{j}'] = field.type.ttype.value
+            rows[f'p{j}'] = field.position
+        rows[f'v{j}'] = columns[j].array
+
+    return rows.dtype.itemsize, rows.tobytes()
@@ -129,10 +129,16 @@ class SignMap:
             self._class_map[class_type] = (raw, sign_type, reader)
 
 
-def load_sign_map(filepath):
+def load_sign_map(filepath, reload=False):
     data = load_yaml_data(filepath)
     if data:
         sign_map = SignMap(data)
+        if reload:
+            # sign map中缓存了类型，类型重新加载时也需要重新创建
+            Global.language = sign_map.language
+            Global.SignMap = sign_map
+            return sign_map
+
         cache_attr(Global, 'language', sign_map.language)
         return cache_attr(Global, 'SignMap', sign_map)
     return None
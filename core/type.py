@@ -2,8 +2,12 @@
 # -*- coding: utf_8 -*-
 
 import struct
+import sys
 import enum
-from .utils import parse_value_list, expend_array
+from array import array
+from collections import OrderedDict
+from itertools import chain
+from .utils import parse_value_list, expend_array, ExpandRange
 
 
 class TType(enum.IntEnum):
@@ -33,6 +37,8 @@ class TType(enum.IntEnum):
 
 StringEncodingOfPack = 'utf-8'
 PackTType = False
+ConvertCacheSize = 4096  # 每个容器类型最多缓存多少个单元格的转换结果，0 表示不缓存
+PackRunLength = False  # 整数列表按等差段打包，数量写成负的段数，每段是 首个值、步长、个数
 
 
 def _pack_str(val):
@@ -43,6 +49,71 @@ def _pack_str(val):
     return struct.pack(f'<i{length}s', length, val_bytes)
 
 
+_int_array_packable = array('i').itemsize == 4
+_exact_int_max = 2 ** 53  # float能精确表示的整数范围，范围内的整数转换后不变
+
+
+class RangeList:
+    """展开范围后的容器转换结果，ExpandRange不生成list，其他值按顺序保存，使用时和list一样"""
+
+    def __init__(self, segments):
+        self._segments = segments  # list 或者 ExpandRange
+        self._len = sum(map(len, segments))
+
+    @property
+    def segments(self):
+        return self._segments
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._segments)
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, RangeList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def to_array(self):
+        values = array('i', bytes(4 * self._len))
+        pos = 0
+        for segment in self._segments:
+            values[pos:pos + len(segment)] = array('i', segment)
+            pos += len(segment)
+        return values
+
+
+def _pack_int_runs(values):
+    # 按等差段打包，比逐个打包小时才使用，否则返回None
+    values = list(values)
+    count = len(values)
+    runs = []
+    i = 0
+    while i < count:
+        j = i + 1
+        step = values[j] - values[i] if j < count else 0
+        while j < count and values[j] - values[j - 1] == step:
+            j += 1
+        if step > 2147483647 or step < -2147483648:
+            return None
+        runs.extend([values[i], step, j - i])
+        i = j
+
+    if len(runs) >= count:
+        return None
+
+    return struct.pack(f'<i{len(runs)}i', -(len(runs) // 3), *runs)
+
+
 class TypeMap:
     def __init__(self):
         self._type_map = {
@@ -51,6 +122,7 @@ class TypeMap:
             'F': Float(),
             'S': String()
         }
+        self._builtin_map = dict(self._type_map)
 
     def __getitem__(self, item):
         value = item.replace(' ', '')
@@ -65,12 +137,110 @@ class TypeMap:
 
         self._type_map[type.name] = type
 
+    def save_builtin(self):
+        self._builtin_map = dict(self._type_map)
+
+    def reset(self):
+        # 只保留内置类型，清除从define中加载的enum、struct和容器类型
+        self._type_map = dict(self._builtin_map)
+
+    def convert_cache_stats(self):
+        hits, misses = 0, 0
+        for handler in self._type_map.values():
+            cache = handler.convert_cache
+            if cache is not None:
+                hits += cache.hits
+                misses += cache.misses
+        return hits, misses
+
+
+class ConvertCache:
+    """按单元格原始字符串缓存转换结果和每种打包方式的字节，超过大小时淘汰最久没用到的"""
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._entries = OrderedDict()  # 原始字符串 -> (ok, target, {打包方式: bytes})
+        self._packed = {}  # id(target) -> {打包方式: bytes}，target由_entries持有，id不会被复用
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, val):
+        entry = self._entries.get(val, None)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(val)
+        return entry
+
+    def put(self, val, ok, target):
+        packed = {}
+        self._entries[val] = (ok, target, packed)
+        self._packed[id(target)] = packed
+
+        if len(self._entries) > self._max_size:
+            _, (_, old_target, old_packed) = self._entries.popitem(last=False)
+            if self._packed.get(id(old_target), None) is old_packed:
+                del self._packed[id(old_target)]
+
+    def packed_of(self, target):
+        return self._packed.get(id(target), None)
+
+
+def cached_convert(convert):
+    # 缓存的结果在多行之间共享，转换结果只读，不能修改
+    def convert_with_cache(self, val, *args):
+        if args or ConvertCacheSize <= 0 or not isinstance(val, str):
+            return convert(self, val, *args)
+
+        cache = self._convert_cache
+        if cache is None:
+            cache = self._convert_cache = ConvertCache(ConvertCacheSize)
+
+        entry = cache.get(val)
+        if entry is not None:
+            return entry[0], entry[1]
+
+        ok, target = convert(self, val)
+        cache.put(val, ok, target)
+        return ok, target
+
+    return convert_with_cache
+
+
+def cached_pack(pack):
+    def pack_with_cache(self, val):
+        cache = self._convert_cache
+        packed = cache.packed_of(val) if cache is not None else None
+        if packed is None:
+            return pack(self, val)
+
+        mode = (PackTType, StringEncodingOfPack, PackRunLength)
+        val_bytes = packed.get(mode, None)
+        if val_bytes is None:
+            val_bytes = packed[mode] = pack(self, val)
+        return val_bytes
+
+    return pack_with_cache
+
 
 class Handler:
+    # 定长类型的struct格式，行打包时可以和相邻的定长字段合并打包
+    pack_format = None
+    _convert_cache = None
+
     @property
     def name(self):
         return ''
 
+    @property
+    def convert_cache(self):
+        return self._convert_cache
+
     @property
     def code_name(self):
         return ''
@@ -81,9 +251,35 @@ class Handler:
     def check(self, val, setting):
         return True, ''
 
+    def index_values(self, val, member=None):
+        # 索引检查时需要检查的值，容器类型返回其中的元素
+        yield val
+
     def pack(self, val):
         return self.pack_value(val)
 
+    def pack_values(self, values):
+        # 容器中的元素一起打包，定长类型只需要一次struct.pack
+        if isinstance(values, RangeList) and self.pack_format == 'i' and _int_array_packable:
+            values = values.to_array()
+            if sys.byteorder == 'big':
+                values.byteswap()
+            return values.tobytes()
+
+        if self.pack_format:
+            return struct.pack(f'<{len(values)}{self.pack_format}', *values)
+
+        return b''.join([self.pack(val) for val in values])
+
+    def pack_count_values(self, values):
+        # 元素个数和所有元素
+        if PackRunLength and self.pack_format == 'i':
+            runs_bytes = _pack_int_runs(values)
+            if runs_bytes:
+                return runs_bytes
+
+        return Int.pack_value(len(values)) + self.pack_values(values)
+
     @staticmethod
     def check_range(val, setting):
         if not setting.check_range(val):
@@ -100,20 +296,28 @@ class Handler:
 
     @staticmethod
     def check_list(val, setting):
-        if not isinstance(val, list) and not isinstance(val, set):
+        if not isinstance(val, list) and not isinstance(val, set) and not isinstance(val, RangeList):
             return False, f'val {val}, is not list and not set'
 
         ok, info = Handler.check_len_range(len(val), setting)
         if not ok:
             return ok, info
 
-        for v in val:
-            if isinstance(v, int) or isinstance(v, float):
-                if v > 2147483647 or v < -2147483648:
-                    return False, f'invalid int data {v}, too big or too small'
-            ok, info = Handler.check_range(v, setting)
-            if not ok:
-                return ok, info
+        segments = val.segments if isinstance(val, RangeList) else [val]
+        for segment in segments:
+            if isinstance(segment, ExpandRange):
+                # 范围的两端都在int范围内，并且在同一个range中，中间的值也一定满足
+                min_val, max_val = segment.bounds
+                if min_val >= -2147483648 and max_val <= 2147483647 and setting.check_range_bounds(min_val, max_val):
+                    continue
+
+            for v in segment:
+                if isinstance(v, int) or isinstance(v, float):
+                    if v > 2147483647 or v < -2147483648:
+                        return False, f'invalid int data {v}, too big or too small'
+                ok, info = Handler.check_range(v, setting)
+                if not ok:
+                    return ok, info
 
         return True, ''
 
@@ -139,11 +343,44 @@ class Handler:
         if value_type_name not in ['I', 'I8', 'I16', 'I32', 'I64']:
             return value_list
 
-        return expend_array(value_list, 200)
+        return expend_array(value_list, 200, True)
+
+    def _convert_value_list(self, val_list, val):
+        # val_list 中的ExpandRange都是整数，不需要再逐个转换，结果是RangeList
+        segments = []
+        result_list = []
+        index = 0
+        for item in val_list:
+            if isinstance(item, ExpandRange):
+                min_val, max_val = item.bounds
+                if -_exact_int_max <= min_val and max_val <= _exact_int_max:
+                    if len(result_list) > 0:
+                        segments.append(result_list)
+                        result_list = []
+                    segments.append(item)
+                    index += len(item)
+                    continue
+
+            for v in (item if isinstance(item, ExpandRange) else [item]):
+                ok, target = self._val_handler.convert(v)
+                if not ok:
+                    flat_list = list(chain.from_iterable(
+                        [v] if not isinstance(v, ExpandRange) else v for v in val_list))
+                    raise Exception(f"invalid value {v}, in val_list {flat_list}, index {index}, val {val}")
+                result_list.append(target)
+                index += 1
+
+        if len(segments) == 0:
+            return result_list
+
+        if len(result_list) > 0:
+            segments.append(result_list)
+        return RangeList(segments)
 
 
 class Bool(Handler):
     ttype = TType.BOOL
+    pack_format = '?'
 
     @property
     def name(self):
@@ -197,6 +434,7 @@ class IntBase(Handler):
 
 class Int8(IntBase):
     ttype = TType.I08
+    pack_format = 'b'
 
     @property
     def name(self):
@@ -213,6 +451,7 @@ class Int8(IntBase):
 
 class Int16(IntBase):
     ttype = TType.I16
+    pack_format = 'h'
 
     @property
     def name(self):
@@ -229,6 +468,7 @@ class Int16(IntBase):
 
 class Int(IntBase):
     ttype = TType.I32
+    pack_format = 'i'
 
     @property
     def name(self):
@@ -245,6 +485,7 @@ class Int(IntBase):
 
 class Float(Handler):
     ttype = TType.FLOAT
+    pack_format = 'f'
 
     @property
     def name(self):
@@ -320,12 +561,20 @@ GTypeMap = TypeMap()
 
 class Enum(Handler):
     ttype = TType.I32
+    pack_format = 'i'
 
     def __init__(self, enum_name, enum_class, default_value):
         self._name = enum_name
         self._enum = enum_class
         self._default = default_value
 
+        # 值和名字的查找表，记录成员的序号，两个都匹配时和按顺序查找一样使用前面的成员
+        self._values = {}
+        self._names = {}
+        for i, (name, member) in enumerate(self._enum.__members__.items()):
+            self._values.setdefault(member.value, (i, member.value))
+            self._names.setdefault(name, (i, member.value))
+
         GTypeMap.register(self)
 
     @property
@@ -339,11 +588,14 @@ class Enum(Handler):
     def convert(self, val):
         result, int_val = IntBase.convert_value(val)
 
-        for name, member in self._enum.__members__.items():
-            if result and member.value == int_val:
-                return True, int_val
-            elif isinstance(val, str) and name == val:
-                return True, member.value
+        value_match = self._values.get(int_val, None) if result else None
+        name_match = self._names.get(val, None) if isinstance(val, str) else None
+        if value_match and name_match:
+            return True, min(value_match, name_match)[1]
+        elif value_match:
+            return True, int_val
+        elif name_match:
+            return True, name_match[1]
 
         raise Exception(f"invalid value {val}, in enum {self.name}")
 
@@ -376,11 +628,11 @@ class Array(Handler):
     def code_name(self):
         return f'array<{self._val_handler.code_name}, {self._val_len}>'
 
+    @cached_convert
     def convert(self, val):
         if val is None:
             return True, []
 
-        result_list = []
         val_list = val
         if isinstance(val, str):
             val_list = self._parse_value_list(val)
@@ -388,29 +640,25 @@ class Array(Handler):
             val_list = [val]
 
         val_list = self._expend_array(val_list, self._val_handler.name)
-
-        for i, v in enumerate(val_list):
-            ok, target = self._val_handler.convert(v)
-            if not ok:
-                raise Exception(f"invalid value {v}, in val_list {val_list}, index {i}, val {val}")
-            result_list.append(target)
-        return True, result_list
+        return True, self._convert_value_list(val_list, val)
 
     def check(self, val, setting):
         return self.check_list(val, setting)
 
-    def pack(self, val_data):
+    def index_values(self, val, member=None):
+        for v in val:
+            yield from self._val_handler.index_values(v, member)
+
+    @cached_pack
+    def pack(self, val_list):
+        # val_list 是convert的结果，不需要再解析
         val_bytes = []
-        val_list = self._parse_value_list(val_data)
 
         if PackTType:
             val_bytes.append(Int8.pack_value(self._val_handler.ttype.value))
 
-        val_bytes.append(Int.pack_value(len(val_list)))
+        val_bytes.append(self._val_handler.pack_count_values(val_list))
 
-        for val in val_list:
-            val_bytes.append(self._val_handler.pack(val))
-        
         return bytes.join(b'', val_bytes)
 
 
@@ -440,6 +688,7 @@ class List(Handler):
 
         return super()._split_char_of_value_list()
 
+    @cached_convert
     def convert(self, val, default=None):
         if default is None:
             default = []
@@ -447,7 +696,6 @@ class List(Handler):
         if val is None:
             return True, default
 
-        result_list = []
         val_list = val
         if isinstance(val, str):
             val_list = self._parse_value_list(val)
@@ -455,27 +703,24 @@ class List(Handler):
             val_list = [val]
 
         val_list = self._expend_array(val_list, self._val_handler.name)
-
-        for i, v in enumerate(val_list):
-            ok, target = self._val_handler.convert(v)
-            if not ok:
-                raise Exception(f"invalid value {v}, in val_list {val_list}, index {i}, val {val}")
-            result_list.append(target)
-        return True, result_list
+        return True, self._convert_value_list(val_list, val)
 
     def check(self, val, setting):
         return self.check_list(val, setting)
 
-    def pack(self, val_data):
+    def index_values(self, val, member=None):
+        for v in val:
+            yield from self._val_handler.index_values(v, member)
+
+    @cached_pack
+    def pack(self, val_list):
+        # val_list 是convert的结果，不需要再解析
         val_bytes = []
-        val_list = self._parse_value_list(val_data)
 
         if PackTType:
             val_bytes.append(Int8.pack_value(self._val_handler.ttype.value))
 
-        val_bytes.append(Int.pack_value(len(val_list)))
-        for val in val_list:
-            val_bytes.append(self._val_handler.pack(val))
+        val_bytes.append(self._val_handler.pack_count_values(val_list))
 
         return bytes.join(b'', val_bytes)
 
@@ -486,6 +731,7 @@ GTypeMap.register(List('F', 'LF'))
 GTypeMap.register(List('S', 'LS'))
 GTypeMap.register(String('LEffect'))
 GTypeMap.register(String('Effect'))
+GTypeMap.save_builtin()
 
 
 class Set(Handler):
@@ -505,6 +751,7 @@ class Set(Handler):
     def code_name(self):
         return f'set<{self._val_handler.code_name}>'
 
+    @cached_convert
     def convert(self, val, default=None):
         if default is None:
             default = set()
@@ -512,7 +759,6 @@ class Set(Handler):
         if val is None:
             return True, default
 
-        result_list = []
         val_list = val
         if isinstance(val, str):
             val_list = self._parse_value_list(val)
@@ -520,27 +766,24 @@ class Set(Handler):
             val_list = [val]
 
         val_list = self._expend_array(val_list, self._val_handler.name)
-
-        for i, v in enumerate(val_list):
-            ok, target = self._val_handler.convert(v)
-            if not ok:
-                raise Exception(f"invalid value {v}, in val_list {val_list}, index {i}, val {val}")
-            result_list.append(target)
-        return True, set(result_list)
+        return True, set(self._convert_value_list(val_list, val))
 
     def check(self, val, setting):
         return self.check_list(val, setting)
 
-    def pack(self, val_data):
+    def index_values(self, val, member=None):
+        for v in val:
+            yield from self._val_handler.index_values(v, member)
+
+    @cached_pack
+    def pack(self, val_set):
+        # convert的结果是set，按排序后的顺序打包，保证每次生成的数据一致
         val_bytes = []
-        val_list = self._parse_value_list(val_data)
 
         if PackTType:
             val_bytes.append(Int8.pack_value(self._val_handler.ttype.value))
 
-        val_bytes.append(Int.pack_value(len(val_list)))
-        for val in val_list:
-            val_bytes.append(self._val_handler.pack(val))
+        val_bytes.append(self._val_handler.pack_count_values(sorted(val_set)))
 
         return bytes.join(b'', val_bytes)
 
@@ -565,6 +808,7 @@ class Map(Handler):
     def code_name(self):
         return f'map<{self._key_handler.code_name},{self._val_handler.code_name}>'
 
+    @cached_convert
     def convert(self, val, default=None):
         if default is None:
             default = {}
@@ -594,6 +838,18 @@ class Map(Handler):
             result_map[key] = value
         return True, result_map
 
+    def index_values(self, val, member=None):
+        # 默认检查key，member为value时检查value，为其他名字时检查value中结构体的字段
+        if member is None or member == 'key':
+            for k in val:
+                yield from self._key_handler.index_values(k)
+            return
+
+        val_member = None if member == 'value' else member
+        for v in val.values():
+            yield from self._val_handler.index_values(v, val_member)
+
+    @cached_pack
     def pack(self, val_map):
         val_bytes = []
 
@@ -603,9 +859,15 @@ class Map(Handler):
 
         val_bytes.append(Int.pack_value(len(val_map)))
 
-        for key, val in val_map.items():
-            val_bytes.append(self._key_handler.pack(key))
-            val_bytes.append(self._val_handler.pack(val))
+        key_format = self._key_handler.pack_format
+        val_format = self._val_handler.pack_format
+        if key_format and val_format:
+            items_format = '<' + (key_format + val_format) * len(val_map)
+            val_bytes.append(struct.pack(items_format, *chain.from_iterable(val_map.items())))
+        else:
+            for key, val in val_map.items():
+                val_bytes.append(self._key_handler.pack(key))
+                val_bytes.append(self._val_handler.pack(val))
 
         return bytes.join(b'', val_bytes)
 
@@ -625,6 +887,10 @@ class _StructField:
     def position(self):
         return self._position
 
+    @property
+    def handler(self):
+        return self._val_handler
+
     def convert(self, val):
         return self._val_handler.convert(val)
 
@@ -646,6 +912,7 @@ class Struct(Handler):
         self._field_names = []
         self._fields = []
         self._fields_map = {}
+        self._fields_structs = {}  # PackTType -> 所有字段都是定长类型时的(struct.Struct, 参数)
 
         for f in fields_info:
             name, val_type, position = f
@@ -672,6 +939,7 @@ class Struct(Handler):
 
         return super()._split_char_of_value_list()
 
+    @cached_convert
     def convert(self, val):
         result_list = []
         val_list = val
@@ -688,9 +956,54 @@ class Struct(Handler):
             result_list.append(target)
         return True, result_list
 
-    def pack(self, val_data):
+    def index_values(self, val, member=None):
+        # 结构体需要指定检查哪一个字段
+        if member is None:
+            raise Exception(f'index of struct {self._name} need field name, Sheet.Field.member')
+
+        for i, field in enumerate(self._fields):
+            if field.name == member:
+                if i < len(val):
+                    yield from field.handler.index_values(val[i])
+                return
+
+        raise Exception(f'index of struct {self._name}, invalid field name {member}')
+
+    def _get_fields_struct(self):
+        if PackTType in self._fields_structs:
+            return self._fields_structs[PackTType]
+
+        fields_struct = None
+        formats = [field.handler.pack_format for field in self._fields]
+        if all(formats):
+            if PackTType:
+                # 值填入每三个参数中的最后一个，最后是 STOP
+                args = []
+                for field in self._fields:
+                    args.extend([field.handler.ttype.value, field.position, None])
+                args.append(TType.STOP.value)
+                fields_format = ''.join([f'bh{f}' for f in formats]) + 'b'
+            else:
+                args = None
+                fields_format = ''.join(formats)
+            fields_struct = (struct.Struct('<' + fields_format), args)
+
+        self._fields_structs[PackTType] = fields_struct
+        return fields_struct
+
+    @cached_pack
+    def pack(self, val_list):
+        # val_list 是convert的结果，不需要再解析
+        fields_struct = self._get_fields_struct()
+        if fields_struct and len(val_list) == len(self._fields):
+            pack_struct, args = fields_struct
+            if not args:
+                return pack_struct.pack(*val_list)
+
+            args[2::3] = val_list
+            return pack_struct.pack(*args)
+
         val_bytes = []
-        val_list = self._parse_value_list(val_data)
         for i in range(len(val_list)):
             val = val_list[i]
             field = self._fields[i]
@@ -1,6 +1,7 @@
 #! python 3
 # -*- coding: utf_8 -*-
 import os
+import re
 import yaml
 
 
@@ -18,15 +19,15 @@ def process_setting(setting_str, language):
     for s in settings:
         s = s.strip()
 
-        # 判断是否是针对当前language的设置
-        language_setting = s.split(':')
-        if len(language_setting) > 1:
+        # 判断是否是针对当前language的设置，值中可以包含 : 和 =，比如eval表达式
+        language_setting = s.split(':', 1)
+        if len(language_setting) > 1 and '=' not in language_setting[0]:
             setting_language = language_setting[0].strip()
             if setting_language != language:
                 continue
             s = language_setting[1].strip()
 
-        vals = s.split('=')
+        vals = s.split('=', 1)
         key = vals[0].strip()
         if key == '':
             continue
@@ -172,6 +173,44 @@ def is_split_char(c, split_char):
         return c == split_char
 
 
+_escape_map = {'{': '}', '[': ']', '(': ')', '\'': '\'', '"': '"'}
+_escape_starts = '{[("\''
+_escape_char_pattern = re.compile(r'[{\[("\'\\]')
+_token_patterns = {}  # split_char -> 匹配括号、引号和分隔符的正则
+
+
+def _get_split_chars(split_char):
+    if split_char == ',':
+        return ',，'
+    if len(split_char) == 1:
+        return split_char
+    # 多个字符的分隔符和单个字符比较永远不相等
+    return ''
+
+
+def _get_token_pattern(split_char):
+    pattern = _token_patterns.get(split_char, None)
+    if pattern is None:
+        chars = '{[("\')]}' + _get_split_chars(split_char)
+        pattern = _token_patterns[split_char] = re.compile('[' + re.escape(chars) + ']')
+    return pattern
+
+
+def _split_flat_value(value_str, split_char):
+    # 没有括号、引号和转义符，直接split，最后一个字符总是留在最后一个值中（末尾的分隔符不会去掉）
+    split_chars = _get_split_chars(split_char)
+    head = value_str[:-1]
+    if split_chars == '':
+        values = [head]
+    else:
+        if len(split_chars) > 1:
+            head = head.replace(split_chars[1], split_chars[0])
+        values = head.split(split_chars[0])
+
+    values[-1] += value_str[-1]
+    return [value.strip() for value in values]
+
+
 def parse_value_list(value_str, split_char=','):
     assert isinstance(value_str, str)
 
@@ -195,38 +234,47 @@ def parse_value_list(value_str, split_char=','):
 
     if start > 0:
         value_str = value_str[start:end]
-    i = 0
+
     l = len(value_str)
+    if l == 0:
+        return value_list
+
+    if not _escape_char_pattern.search(value_str):
+        return _split_flat_value(value_str, split_char)
+
+    # 只需要处理括号、引号、分隔符和最后一个字符，其他字符不影响结果
+    positions = [m.start() for m in _get_token_pattern(split_char).finditer(value_str)]
+    if len(positions) == 0 or positions[-1] != l - 1:
+        positions.append(l - 1)
+
+    split_chars = _get_split_chars(split_char)
     prev = 0
-    escape_map = {'{': '}', '[': ']', '(': ')', '\'': '\'', '"': '"'}
     escape_chars = []
     cur_escape_char = None
-    while i < l:
-        is_escaped = (i < l and value_str[i - 1] == '\\')
-        if is_escaped:
-            i += 1
+    for i in positions:
+        # 前一个字符是转义符时跳过，第一个字符和原来一样检查的是最后一个字符
+        if value_str[i - 1] == '\\':
             continue
 
         c = value_str[i]
-        if c in '{[("\'':
+        # 引号也在这里处理，所以引号只会开始不会结束
+        if c in _escape_starts:
             if cur_escape_char:
                 escape_chars.append(cur_escape_char)
             cur_escape_char = c
-            i += 1
             continue
 
-        if cur_escape_char and c == escape_map[cur_escape_char]:
+        if cur_escape_char and c == _escape_map[cur_escape_char]:
             if len(escape_chars) == 0:
                 cur_escape_char = None
             else:
                 cur_escape_char = escape_chars.pop()
-            i += 1
-            if i == l:
+            if i + 1 == l:
                 value = value_str[prev:]
                 value_list.append(value.strip())
             continue
 
-        if not cur_escape_char and (is_split_char(c, split_char) or i + 1 == l):
+        if not cur_escape_char and (c in split_chars or i + 1 == l):
             if i + 1 == l:
                 value = value_str[prev:]
             else:
@@ -234,8 +282,6 @@ def parse_value_list(value_str, split_char=','):
             value_list.append(value.strip())
             prev = i + 1
 
-        i += 1
-
     return value_list
 
 
@@ -255,7 +301,50 @@ def find_all_char_in_string(str_value, chars):
     return True
 
 
-def expand_array_value(val, max_length=0):
+_digits_re = re.compile(r'[0-9]*')
+
+
+class ExpandRange:
+    """<begin-end> 表示的整数序列，不展开成list，用到时才生成每个值"""
+
+    def __init__(self, prefix, suffix, head, tail, step):
+        self._prefix = prefix
+        self._suffix = suffix
+        self._range = range(head, tail, step)
+
+        # 和展开成list时一样从第一个值开始计算，格式不对时抛出同样的异常
+        self._first = self.value(self._range[0])
+        self._last = self.value(self._range[-1])
+
+        # 前后缀都是数字并且序号位数不变时，展开后是等差数列
+        self._values = None
+        if _digits_re.fullmatch(prefix) and _digits_re.fullmatch(suffix) and \
+                len(str(self._range[0])) == len(str(self._range[-1])):
+            value_step = step * 10 ** len(suffix)
+            self._values = range(self._first, self._last + value_step, value_step)
+
+    def value(self, i):
+        return int(f'{self._prefix}{i}{self._suffix}')
+
+    @property
+    def bounds(self):
+        # 值随序号单调变化，最小值和最大值在两端
+        return min(self._first, self._last), max(self._first, self._last)
+
+    def __len__(self):
+        return len(self._range)
+
+    def __iter__(self):
+        if self._values is not None:
+            return iter(self._values)
+        return map(self.value, self._range)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def expand_array_range(val, max_length=0):
+    """和expand_array_value一样，展开的结果是ExpandRange"""
     value_list = []
     if not isinstance(val, str):
         value_list.append(val)
@@ -342,26 +431,31 @@ def expand_array_value(val, max_length=0):
         raise Exception(
             f'the length {step_length} is more than {max_length}, expend node ({head_value} - {tail_value}) in expand_array {value}')
 
-    for i in range(head_value, tail_value, step):
-        result_list = []
-        for node in node_list:
-            if isinstance(node, tuple):
-                result_list.append(f'{i}')
-            else:
-                result_list.append(node)
+    if tuple_count == 0:
+        value_list.append(int(''.join(node_list)))
+        return value_list, True
+
+    tuple_index = next(i for i, node in enumerate(node_list) if isinstance(node, tuple))
+    prefix = ''.join(node_list[:tuple_index])
+    suffix = ''.join(node_list[tuple_index + 1:])
+    return ExpandRange(prefix, suffix, head_value, tail_value, step), True
 
-        result = int(''.join(result_list))
-        value_list.append(result)
 
-    return value_list, True
+def expand_array_value(val, max_length=0):
+    value_list, is_expand = expand_array_range(val, max_length)
+    return list(value_list), is_expand
 
 
-def expend_array(value_list, max_expend_length=0):
+def expend_array(value_list, max_expend_length=0, keep_range=False):
     result = []
     is_result_expend = False
     for value in value_list:
-        expend_list, is_expend = expand_array_value(value, max_expend_length)
-        result.extend(expend_list)
+        expend_list, is_expend = expand_array_range(value, max_expend_length)
+        if keep_range and isinstance(expend_list, ExpandRange):
+            # 保留ExpandRange，由调用者按范围处理
+            result.append(expend_list)
+        else:
+            result.extend(expend_list)
         if is_expend:
             is_result_expend = True
 
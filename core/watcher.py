@@ -0,0 +1,58 @@
+#! python 3
+# -*- coding: utf_8 -*-
+
+import os
+import time
+
+
+def get_files_state(files):
+    state = {}
+    for file in files:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            continue
+
+        state[file] = (stat.st_mtime_ns, stat.st_size)
+
+    return state
+
+
+class FileWatcher:
+    """poll the files returned by get_files, report the changed files once they stop changing."""
+
+    def __init__(self, get_files, interval=0.5):
+        self._get_files = get_files
+        self._interval = interval
+        self._state = get_files_state(self._get_files())
+
+    def _diff(self, state):
+        changed = set()
+        for file, file_state in state.items():
+            if self._state.get(file, None) != file_state:
+                changed.add(file)
+
+        for file in self._state:
+            if file not in state:
+                changed.add(file)
+
+        return changed
+
+    def wait_changes(self):
+        while True:
+            time.sleep(self._interval)
+            state = get_files_state(self._get_files())
+            if not self._diff(state):
+                continue
+
+            # excel保存时会先写临时文件，等文件不再变化后再处理
+            while True:
+                time.sleep(self._interval)
+                new_state = get_files_state(self._get_files())
+                if new_state == state:
+                    break
+                state = new_state
+
+            changed = self._diff(state)
+            self._state = state
+            return changed
@@ -1,6 +1,7 @@
 
 import math
 import xlrd
+from array import array
 
 printer = print
 
@@ -10,9 +11,17 @@ class Coor:
         self.r = r
         self.c = c
 
-        self.calpha = ctoa(c)
-        self.ralpha = f'{r+1}'
-        self.rc = f'{self.ralpha}{self.calpha}'
+    @property
+    def calpha(self):
+        return ctoa(self.c)
+
+    @property
+    def ralpha(self):
+        return f'{self.r+1}'
+
+    @property
+    def rc(self):
+        return f'{self.ralpha}{self.calpha}'
 
 
 def log(msg):
@@ -59,7 +68,69 @@ def trim(s):
     return s
 
 
+class SheetData:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+
+class LazyBook:
+    """第一次使用sheet时才打开xlrd book，表格处理完后可以卸载"""
+
+    def __init__(self, file_path, on_demand):
+        self._file_path = file_path
+        self._on_demand = on_demand
+        self._book = None
+
+    def _open(self):
+        if not self._book:
+            self._book = xlrd.open_workbook(self._file_path, ragged_rows=True, on_demand=self._on_demand)
+        return self._book
+
+    def get_sheet(self, name):
+        if self._book and not self._on_demand and not self._book.sheet_loaded(name):
+            # 不支持on_demand时，卸载后的sheet不能单独加载，重新打开book
+            self.release()
+
+        return self._open().sheet_by_name(name)
+
+    def unload_sheet(self, name):
+        if self._book and self._book.sheet_loaded(name):
+            self._book.unload_sheet(name)
+
+    def release(self):
+        if self._book:
+            self._book.release_resources()
+            self._book = None
+
+
+class LazySheet:
+    def __init__(self, book, name):
+        self.book = book
+        self.name = name
+
+    @property
+    def sheet(self):
+        return self.book.get_sheet(self.name)
+
+
+def unload_sheet(sheet):
+    if isinstance(sheet, LazySheet):
+        sheet.book.unload_sheet(sheet.name)
+
+
+def release_book(sheet):
+    if isinstance(sheet, LazySheet):
+        sheet.book.release()
+
+
 def array2d(sheet: xlrd.sheet.Sheet):
+    if isinstance(sheet, SheetData):
+        return sheet.rows
+
+    if isinstance(sheet, LazySheet):
+        sheet = sheet.sheet
+
     return [
         [cell.value for cell in row]
         for row in sheet.get_rows()
@@ -68,15 +139,19 @@ def array2d(sheet: xlrd.sheet.Sheet):
 
 def array2d_transpose(sheet: xlrd.sheet.Sheet):
     a2d = array2d(sheet)
-    rows = []
-    for i, row in enumerate(a2d):
-        for j, cell in enumerate(row):
-            if i == 0:
-                rows.append([])
+    if len(a2d) == 0:
+        return []
 
-            rows[j].append(cell)
+    col_count = len(a2d[0])
+    if all(len(row) == col_count for row in a2d):
+        return [list(column) for column in zip(*a2d)]
 
-    return rows
+    # 第一行决定列数，较短的行不填充空值，后面的单元格直接上移
+    for i, row in enumerate(a2d):
+        if len(row) > col_count:
+            raise Exception(f'transpose failed, row {i + 1} is longer than the first row')
+
+    return [[row[j] for row in a2d if j < len(row)] for j in range(col_count)]
 
 
 def findsign(array2d, verify):
@@ -84,14 +159,12 @@ def findsign(array2d, verify):
         raise Exception(
             'signchecker not callable in signrow(array2d, signchecker)')
 
+    # 和之前一样，最后一个包含标记的行作为标记行
     ifrow = None
 
     for ir, row in enumerate(array2d):
-        for ic, cell in enumerate(row):
-            if not verify(cell):
-                continue
+        if any(map(verify, row)):
             ifrow = ir
-            break
 
     if ifrow is None:
         raise Exception('CAN NOT find sign row')
@@ -108,10 +181,43 @@ def findsign(array2d, verify):
     return signpos
 
 
+class NormalizedSheet:
+    """规范化后的表格，按列保存单元格的值，所有列共用一个行号数组"""
+
+    def __init__(self, cols, rows, columns):
+        self.cols = cols  # 每一列在sheet中的列号
+        self.rows = rows  # 每一行在sheet中的行号
+        self.columns = columns
+        self._append_start = len(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def row_values(self, i):
+        return [column[i] for column in self.columns]
+
+    def coordinate(self, i, j):
+        # 追加的测试数据行，列号使用的是字段的序号
+        if i >= self._append_start:
+            return self.rows[i], j
+        return self.rows[i], self.cols[j]
+
+    def slice(self, start, end=None):
+        return NormalizedSheet(self.cols, self.rows[start:end], [column[start:end] for column in self.columns])
+
+    def append_row(self, r, values):
+        if len(values) < len(self.columns):
+            raise Exception(f'row {r} has {len(values)} values, need {len(self.columns)}')
+
+        self.rows.append(r)
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+
 def normalize(array2d, signpos):
     ifrow = signpos[0].r
     ifcol = signpos[0].c
-    normalied = []
+    rows = array('i')
     index = 0
 
     for r in range(ifrow, len(array2d)):
@@ -133,18 +239,14 @@ def normalize(array2d, signpos):
             if first is str and '#' in first:
                 continue
 
-        newrow = []
-        for coor in signpos:
-            if coor.c >= maxcol:
-                cell = None
-            else:
-                cell = trim(cells[coor.c])
-
-            newrow.append((r, coor.c, cell))
+        rows.append(r)
 
-        normalied.append(newrow)
+    columns = []
+    for coor in signpos:
+        c = coor.c
+        columns.append([trim(array2d[r][c]) if c < len(array2d[r]) else None for r in rows])
 
-    return normalied
+    return NormalizedSheet([coor.c for coor in signpos], rows, columns)
 
 
 def normalize_sheet(sheet: xlrd.sheet.Sheet, signverify, transpose):
@@ -0,0 +1,361 @@
+#! python 3
+# -*- coding: utf_8 -*-
+
+import re
+import html
+import zipfile
+import xml.etree.ElementTree as ET
+from .xlproc import SheetData
+
+# 直接读取xlsx文件中的xml，得到的单元格值与 xlrd.open_workbook(ragged_rows=True) 一致
+
+_ns_main = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_ns_rel = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_ns_pkg_rel = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_xml_space = '{http://www.w3.org/XML/1998/namespace}space'
+_xml_whitespace = '\t\n \r'
+
+_tag_row = f'{_ns_main}row'
+_tag_sheet_data = f'{_ns_main}sheetData'
+_tag_v = f'{_ns_main}v'
+_tag_is = f'{_ns_main}is'
+_tag_si = f'{_ns_main}si'
+_tag_t = f'{_ns_main}t'
+_tag_r = f'{_ns_main}r'
+
+_escape_re = re.compile(r'_x[0-9A-Fa-f]{4}_')
+
+# sheetData中的行和单元格直接用正则切分，常见的数值、共享字符串单元格不需要构建xml节点
+# 属性顺序不是 r s t 或者内容比较复杂的单元格，使用ElementTree解析
+_row_start_re = re.compile(r'<row\b([^>]*?)(/?)>')
+_row_number_re = re.compile(r'\br=["\'](\d+)["\']')
+_cell_re = re.compile(
+    r'<c r="([A-Z]+)\d+"(?: s="\d+")?(?: t="(\w+)")?(?:/>|>(?:<f\b[^>]*?(?:/>|>[^<]*</f>))?(?:<v>([^<]*)</v>|<is><t>([^<]*)</t></is>)</c>)'
+    r'|(<c\b[^>]*?(?:/>|>.*?</c>))', re.S)
+
+_read_chunk_size = 1 << 20
+
+_error_codes = {
+    '#NULL!': 0x00,
+    '#DIV/0!': 0x07,
+    '#VALUE!': 0x0F,
+    '#REF!': 0x17,
+    '#NAME?': 0x1D,
+    '#NUM!': 0x24,
+    '#N/A': 0x2A,
+}
+
+_no_value = object()
+
+_bool_values = {None: 0, '': 0, '1': 1, 'true': 1, 'on': 1, '0': 0, 'false': 0, 'off': 0}
+
+
+def is_xlsx_file(file_path):
+    return file_path.lower().endswith(('.xlsx', '.xlsm'))
+
+
+def _unescape(s):
+    if '_' in s:
+        return _escape_re.sub(lambda m: chr(int(m.group(0)[2:6], 16)), s)
+    return s
+
+
+def _cooked_text(elem):
+    t = elem.text
+    if t is None:
+        return ''
+    if elem.get(_xml_space) != 'preserve':
+        t = t.strip(_xml_whitespace)
+    return _unescape(t)
+
+
+def _rich_text(elem):
+    # <si> 或 <is>，忽略拼音等其他节点
+    texts = []
+    for child in elem:
+        if child.tag == _tag_t:
+            texts.append(_cooked_text(child))
+        elif child.tag == _tag_r:
+            for t_node in child:
+                if t_node.tag == _tag_t:
+                    texts.append(_cooked_text(t_node))
+    return ''.join(texts)
+
+
+def _cell_column(cell_name):
+    col = 0
+    for c in cell_name:
+        if c == '$':
+            continue
+        if 'A' <= c <= 'Z':
+            col = col * 26 + ord(c) - 64
+        else:
+            break
+    return col - 1
+
+
+def _cell_value(cell, cell_type, shared_strings):
+    # 返回 _no_value 表示空单元格，不写入行中
+    text = None
+    text_elem = None
+    for child in cell:
+        if child.tag == _tag_v:
+            text_elem = child
+            text = child.text
+        elif child.tag == _tag_is:
+            text = _rich_text(child)
+
+    if cell_type == 'n':
+        return float(text) if text else _no_value
+    elif cell_type == 's':
+        return shared_strings[int(text)] if text else _no_value
+    elif cell_type == 'str':
+        return _cooked_text(text_elem) if text_elem is not None else None
+    elif cell_type == 'b':
+        return _bool_values[text]
+    elif cell_type == 'e':
+        return _error_codes[text or '#N/A']
+    elif cell_type == 'inlineStr':
+        return text if text else _no_value
+
+    raise Exception(f'unknown cell type {cell_type}, cell {cell.get("r")}')
+
+
+def _inline_text_value(text):
+    if '&' in text:
+        text = html.unescape(text)
+    text = _unescape(text.strip(_xml_whitespace))
+    return text if text else _no_value
+
+
+_column_cache = {}
+
+
+def _column_index(col_name):
+    col = _column_cache.get(col_name, None)
+    if col is None:
+        col = _cell_column(col_name)
+        _column_cache[col_name] = col
+    return col
+
+
+def _get_row_values(rows, row_index):
+    while len(rows) <= row_index:
+        rows.append([])
+    return rows[row_index]
+
+
+def _set_row_value(values, col, value):
+    num_empty = col - len(values)
+    if num_empty >= 0:
+        if num_empty > 0:
+            values.extend([''] * num_empty)
+        values.append(value)
+    else:
+        values[col] = value
+
+
+class XlsxReader:
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._zip = None
+        self._names = {}
+        self._shared_strings = None
+
+    def __enter__(self):
+        self._zip = zipfile.ZipFile(self._file_path)
+        self._names = {name.replace('\\', '/').lower(): name for name in self._zip.namelist()}
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._zip.close()
+        self._zip = None
+
+    def _open(self, name):
+        return self._zip.open(self._names[name.lower()])
+
+    def _has(self, name):
+        return name.lower() in self._names
+
+    def sheet_targets(self):
+        # 返回 [(sheet name, xml path)]，与xlrd一样忽略图表等非worksheet
+        rel_types = {}
+        rel_paths = {}
+        with self._open('xl/_rels/workbook.xml.rels') as f:
+            for elem in ET.parse(f).getroot().iter(f'{_ns_pkg_rel}Relationship'):
+                rid = elem.get('Id')
+                target = elem.get('Target').replace('\\', '/')
+                rel_types[rid] = elem.get('Type').split('/')[-1]
+                rel_paths[rid] = target[1:] if target.startswith('/') else f'xl/{target}'
+
+        targets = []
+        with self._open('xl/workbook.xml') as f:
+            for elem in ET.parse(f).getroot().iter(f'{_ns_main}sheet'):
+                rid = elem.get(f'{_ns_rel}id')
+                if rel_types.get(rid, None) != 'worksheet':
+                    continue
+                targets.append((_unescape(elem.get('name')), rel_paths[rid]))
+
+        return targets
+
+    def _load_shared_strings(self):
+        if self._shared_strings is not None:
+            return self._shared_strings
+
+        self._shared_strings = []
+        if not self._has('xl/sharedStrings.xml'):
+            return self._shared_strings
+
+        with self._open('xl/sharedStrings.xml') as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag == _tag_si:
+                    self._shared_strings.append(_rich_text(elem))
+                    elem.clear()
+
+        return self._shared_strings
+
+    def read_rows(self, target):
+        shared_strings = self._load_shared_strings()
+        with self._open(target) as f:
+            rows = self._read_rows_fast(f, shared_strings)
+
+        if rows is None:
+            # 带命名空间前缀等特殊格式的xml，使用ElementTree读取
+            with self._open(target) as f:
+                rows = self._read_rows_by_tree(f, shared_strings)
+
+        return rows
+
+    def _read_rows_fast(self, f, shared_strings):
+        rows = []
+        buffer = b''
+        is_started = False
+        is_end = False
+        row_index = -1
+
+        while not is_end:
+            chunk = f.read(_read_chunk_size)
+            if not chunk:
+                is_end = True
+            buffer += chunk
+
+            if not is_started:
+                start = buffer.find(b'<sheetData')
+                if start < 0:
+                    if is_end or b':sheetData' in buffer:
+                        return None
+                    continue
+
+                is_started = True
+                buffer = buffer[start:]
+
+            # 找到sheetData结尾后，后面的合并单元格、条件格式等都不需要读取
+            end = buffer.find(b'</sheetData>')
+            if end >= 0:
+                is_end = True
+            else:
+                end = buffer.rfind(b'</row>')
+                if end < 0:
+                    continue
+                end += len(b'</row>')
+
+            text = buffer[:end].decode('utf-8')
+            buffer = buffer[end:]
+            for row_text in text.split('</row>'):
+                row_index = self._read_row_text(row_text, row_index, rows, shared_strings)
+
+        return rows
+
+    @staticmethod
+    def _read_row_text(row_text, row_index, rows, shared_strings):
+        # 一段文本中可能有多个不包含单元格的 <row/>，只有最后一个 <row> 包含单元格
+        cells_start = -1
+        for m in _row_start_re.finditer(row_text):
+            row_number = _row_number_re.search(m[1])
+            row_index = int(row_number[1]) - 1 if row_number else row_index + 1
+            cells_start = -1 if m[2] else m.end()
+
+        if cells_start < 0:
+            return row_index
+
+        col = -1
+        values = None
+        for col_name, cell_type, text, inline_text, cell_text in _cell_re.findall(row_text, cells_start):
+            if cell_text:
+                cell = ET.fromstring(cell_text.replace('<c', f'<c xmlns="{_ns_main[1:-1]}"', 1))
+                cell_name = cell.get('r')
+                col = _cell_column(cell_name) if cell_name else col + 1
+                value = _cell_value(cell, cell.get('t', 'n'), shared_strings)
+            else:
+                col = _column_index(col_name)
+                if not cell_type or cell_type == 'n':
+                    value = float(text) if text else _no_value
+                elif cell_type == 's':
+                    value = shared_strings[int(text)] if text else _no_value
+                elif cell_type == 'inlineStr':
+                    value = _inline_text_value(inline_text)
+                elif cell_type == 'b':
+                    value = _bool_values[text]
+                else:
+                    cell = ET.fromstring(f'<c xmlns="{_ns_main[1:-1]}"><v>{text}</v></c>')
+                    value = _cell_value(cell, cell_type, shared_strings)
+
+            if value is _no_value:
+                continue
+
+            if values is None:
+                values = _get_row_values(rows, row_index)
+
+            if col == len(values):
+                values.append(value)
+            else:
+                _set_row_value(values, col, value)
+
+        return row_index
+
+    def _read_rows_by_tree(self, f, shared_strings):
+        rows = []
+        row_index = -1
+        for _, elem in ET.iterparse(f):
+            if elem.tag == _tag_row:
+                row_number = elem.get('r')
+                row_index = int(row_number) - 1 if row_number else row_index + 1
+                self._read_row(elem, row_index, rows, shared_strings)
+                elem.clear()
+            elif elem.tag == _tag_sheet_data:
+                break
+
+        return rows
+
+    @staticmethod
+    def _read_row(row_elem, row_index, rows, shared_strings):
+        col = -1
+        values = None
+        for cell in row_elem:
+            cell_name = cell.get('r')
+            col = _cell_column(cell_name) if cell_name else col + 1
+
+            value = _cell_value(cell, cell.get('t', 'n'), shared_strings)
+            if value is _no_value:
+                continue
+
+            if values is None:
+                values = _get_row_values(rows, row_index)
+            _set_row_value(values, col, value)
+
+
+def read_sheet_names(file_path):
+    with XlsxReader(file_path) as reader:
+        return [name for name, _ in reader.sheet_targets()]
+
+
+def read_book(file_path, sheet_filter=None):
+    sheets = []
+    with XlsxReader(file_path) as reader:
+        for name, target in reader.sheet_targets():
+            if sheet_filter and not sheet_filter(name):
+                continue
+
+            sheets.append(SheetData(name, reader.read_rows(target)))
+
+    return sheets
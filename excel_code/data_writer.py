@@ -1,16 +1,28 @@
 #! python 3
 # -*- coding: utf_8 -*-
-from .sheet import DataStream
+import os
+import struct
+import yaml
+from .sheet import DataStream, FileDataStream
+from core.utils import load_yaml_data
+from core.code import RowPacker
 import core.type as tp
 
 
 class BaseDataWriter:
+    # 打包二进制数据时使用的tp.PackTType，None表示不打包
+    pack_ttype = None
+
     def __init__(self, file_name):
         self._file_name = file_name
 
     def write_file(self):
         pass
 
+    def write_abort(self):
+        # 写入过程中出错时调用，不留下写了一半的文件
+        pass
+
     def write_begin(self):
         pass
 
@@ -26,33 +38,67 @@ class BaseDataWriter:
     def write_sheet_end(self, sheet):
         pass
 
-    def write_row_begin(self, sheet, row_index, row_count):
+    def write_row_begin(self, sheet, row_index, row_count, row):
+        pass
+
+    def write_row_end(self, sheet, row_index, row_count, row):
+        pass
+
+    def write_field_begin(self, field, value):
+        pass
+
+    def write_field_end(self, field, value):
         pass
 
-    def write_row_end(self, sheet, row_index, row_count):
+    def write_numeric_columns(self, sheet, fields, numeric_columns):
         pass
 
-    def write_field_begin(self, field):
+    def write_row_fields(self, sheet, fields, row, row_index=None):
+        # row 是RowData，值和fields一一对应
+        for field, value in zip(fields, row.values):
+            self.write_field_begin(field, value)
+            self.write_field_end(field, value)
+
+    def begin_section(self):
+        # 之后写入的表数据先保存在内存中，由end_section返回，用于在子进程中写表
         pass
 
-    def write_field_end(self, field):
+    def end_section(self):
+        return None
+
+    def write_section(self, section):
+        # 写入end_section返回的数据
         pass
 
 
 class SimpleBinDataWriter(BaseDataWriter):
+    pack_ttype = False
+
     def __init__(self, file_name):
         super().__init__(file_name)
-        self._stream = DataStream()
+        self._stream = None
+        self._file_stream = None
+        self._row_packers = {}
 
     def _write(self, bin_bytes):
         self._stream.write(bin_bytes)
 
     def write_file(self):
-        with open(self._file_name, 'wb') as fp:
-            fp.write(self._stream.data_bytes)
+        self._stream.close()
+        self._stream = None
+
+    def write_abort(self):
+        # 还没有write_begin或者已经write_file时没有需要删除的临时文件
+        if self._file_stream:
+            self._stream = self._file_stream
+            self._file_stream = None
+        if self._stream:
+            self._stream.abort()
+            self._stream = None
 
     def write_begin(self):
-        tp.PackTType = False
+        tp.PackTType = self.pack_ttype
+        self._stream = FileDataStream(self._file_name)
 
     def write_version(self, version):
         self._write(tp.String.pack_value(version))
@@ -60,44 +106,220 @@ class SimpleBinDataWriter(BaseDataWriter):
     def write_sheet_begin(self, sheet, row_len):
         self._write(tp.Int.pack_value(row_len))
 
-    def write_field_begin(self, field):
-        field.pack_data(self._stream)
+    def _get_row_packer(self, sheet, fields):
+        packer = self._row_packers.get(sheet.name, None)
+        if not packer:
+            packer = RowPacker(fields, tp.PackTType)
+            self._row_packers[sheet.name] = packer
+
+        return packer
+
+    def write_numeric_columns(self, sheet, fields, numeric_columns):
+        self._get_row_packer(sheet, fields).set_numeric_columns(numeric_columns)
+
+    def write_row_fields(self, sheet, fields, row, row_index=None):
+        # row_index 不为空时，可以使用numpy按行打包好的数据
+        self._write(self._get_row_packer(sheet, fields).pack(row.values, row_index))
+
+    def begin_section(self):
+        self._file_stream = self._stream
+        self._stream = DataStream()
+
+    def end_section(self):
+        section = self._stream.data_bytes
+        self._stream = self._file_stream
+        return section
+
+    def write_section(self, section):
+        self._write(section)
 
 
 class ThriftBinDataWriter(SimpleBinDataWriter):
+    pack_ttype = True
+
     def __init__(self, file_name):
         super().__init__(file_name)
-        self._full_stream = DataStream()
+        self._sheet_length_pos = 0
+
+    def write_version(self, version):
+        self._write(tp.String.pack_value(version))
+
+    def write_sheet_begin(self, sheet, row_len):
+        self._write(tp.String.pack_value(sheet.name))
+        self._write(tp.Int.pack_value(row_len))
+        # 表数据的长度在写完后回填
+        self._sheet_length_pos = self._stream.reserve_int()
+
+    def write_sheet_end(self, sheet):
+        data_len = self._stream.length - self._sheet_length_pos - 4
+        self._stream.patch_int(self._sheet_length_pos, data_len)
+
+    def write_row_end(self, sheet, row_index, row_count, row):
+        self._write(tp.Int8.pack_value(tp.TType.STOP.value))
+
+    def write_sheet_bytes(self, sheet_name, row_len, data_bytes):
+        # 直接写入之前已经打包好的表数据
+        self._write(tp.String.pack_value(sheet_name))
+        self._write(tp.Int.pack_value(row_len))
+        self._write(tp.Int.pack_value(len(data_bytes)))
+        self._write(data_bytes)
+
+
+class MultiDataWriter(BaseDataWriter):
+    """把写入分发给多个writer，每行数据只需要转换和检查一次"""
+
+    def __init__(self, writers):
+        super().__init__(None)
+        self._writers = writers
+
+    def _each_writer(self):
+        # 二进制writer共用全局的tp.PackTType，调用前切换到这个writer的打包方式
+        for writer in self._writers:
+            if writer.pack_ttype is not None:
+                tp.PackTType = writer.pack_ttype
+            yield writer
 
     def write_file(self):
-        with open(self._file_name, 'wb') as fp:
-            fp.write(self._full_stream.data_bytes)
+        for writer in self._each_writer():
+            writer.write_file()
+
+    def write_abort(self):
+        for writer in self._writers:
+            writer.write_abort()
 
     def write_begin(self):
-        tp.PackTType = True
+        for writer in self._each_writer():
+            writer.write_begin()
+
+    def write_end(self):
+        for writer in self._each_writer():
+            writer.write_end()
 
     def write_version(self, version):
-        self._full_stream.write(tp.String.pack_value(version))
+        for writer in self._each_writer():
+            writer.write_version(version)
 
     def write_sheet_begin(self, sheet, row_len):
-        self._full_stream.write(tp.String.pack_value(sheet.name))
-        self._full_stream.write(tp.Int.pack_value(row_len))
+        for writer in self._each_writer():
+            writer.write_sheet_begin(sheet, row_len)
 
     def write_sheet_end(self, sheet):
-        data_bytes = self._stream.data_bytes
-        self._full_stream.write(tp.Int.pack_value(len(data_bytes)))
-        self._full_stream.write(data_bytes)
+        for writer in self._each_writer():
+            writer.write_sheet_end(sheet)
 
-        self._stream = DataStream()
+    def write_row_begin(self, sheet, row_index, row_count, row):
+        for writer in self._each_writer():
+            writer.write_row_begin(sheet, row_index, row_count, row)
 
-    def write_row_end(self, sheet, row_index, row_count):
-        self._write(tp.Int8.pack_value(tp.TType.STOP.value))
+    def write_row_end(self, sheet, row_index, row_count, row):
+        for writer in self._each_writer():
+            writer.write_row_end(sheet, row_index, row_count, row)
+
+    def write_field_begin(self, field, value):
+        for writer in self._each_writer():
+            writer.write_field_begin(field, value)
+
+    def write_field_end(self, field, value):
+        for writer in self._each_writer():
+            writer.write_field_end(field, value)
+
+    def write_numeric_columns(self, sheet, fields, numeric_columns):
+        for writer in self._each_writer():
+            writer.write_numeric_columns(sheet, fields, numeric_columns)
+
+    def write_row_fields(self, sheet, fields, row, row_index=None):
+        for writer in self._each_writer():
+            writer.write_row_fields(sheet, fields, row, row_index)
+
+    def begin_section(self):
+        for writer in self._each_writer():
+            writer.begin_section()
+
+    def end_section(self):
+        return [writer.end_section() for writer in self._each_writer()]
+
+    def write_section(self, section):
+        for writer, writer_section in zip(self._each_writer(), section):
+            writer.write_section(writer_section)
+
+
+class ThriftBinDataReader:
+    def __init__(self, file_name):
+        self._file_name = file_name
+        self._data = b''
+        self._pos = 0
+
+        self.version = None
+        self.sections = {}  # sheet name -> (row_len, data_bytes)
+
+    def _read_int(self):
+        val, = struct.unpack_from('<i', self._data, self._pos)
+        self._pos += 4
+        return val
+
+    def _read_bytes(self, length):
+        if self._pos + length > len(self._data):
+            raise Exception(f'invalid data file {self._file_name}, unexpected end at {self._pos}')
+
+        val = self._data[self._pos:self._pos + length]
+        self._pos += length
+        return val
+
+    def _read_str(self):
+        length = self._read_int()
+        return self._read_bytes(length).decode(encoding=tp.StringEncodingOfPack)
+
+    def read(self):
+        with open(self._file_name, 'rb') as fp:
+            self._data = fp.read()
+
+        self._pos = 0
+        self.version = self._read_str()
+        while self._pos < len(self._data):
+            name = self._read_str()
+            row_len = self._read_int()
+            length = self._read_int()
+            self.sections[name] = (row_len, self._read_bytes(length))
+
+        self._data = b''
+        return self.sections
+
+
+class DataManifest:
+    def __init__(self, file_name):
+        self._file_name = file_name
+        self.global_hash = None
+        self.data_hash = None
+        self.sheets = {}  # sheet name -> book hash
+
+    def load(self):
+        data = load_yaml_data(self._file_name)
+        if not data:
+            return
+
+        self.global_hash = data.get('global_hash', None)
+        self.data_hash = data.get('data_hash', None)
+        self.sheets = data.get('sheets', None) or {}
+
+    def save(self):
+        data = {
+            'global_hash': self.global_hash,
+            'data_hash': self.data_hash,
+            'sheets': self.sheets
+        }
+        with open(self._file_name, 'w') as fp:
+            yaml.safe_dump(data, fp)
+
+    def remove(self):
+        if os.path.exists(self._file_name):
+            os.remove(self._file_name)
 
 
 class BaseXmlDataWriter(BaseDataWriter):
     def __init__(self, file_name):
         super().__init__(file_name)
         self._lines = []
+        self._file_lines = None
 
     @staticmethod
     def _get_indent_content(indent):
@@ -117,6 +339,18 @@ class BaseXmlDataWriter(BaseDataWriter):
         with open(self._file_name, 'w') as fp:
             fp.write(content)
 
+    def begin_section(self):
+        self._file_lines = self._lines
+        self._lines = []
+
+    def end_section(self):
+        section = self._lines
+        self._lines = self._file_lines
+        return section
+
+    def write_section(self, section):
+        self._lines.extend(section)
+
     def write_begin(self):
         self._write('<root>')
 
@@ -138,14 +372,14 @@ class XmlDataWriter(BaseXmlDataWriter):
     def write_sheet_end(self, sheet):
         self._write(f'</{sheet.member_name}>', 1)
 
-    def write_row_begin(self, sheet, row_index, row_count):
+    def write_row_begin(self, sheet, row_index, row_count, row):
         self._write(f'<{sheet.name}>', 2)
 
-    def write_row_end(self, sheet, row_index, row_count):
+    def write_row_end(self, sheet, row_index, row_count, row):
         self._write(f'</{sheet.name}>', 2)
 
-    def write_field_begin(self, field):
-        self._write(f'<{field.name}>{field.value_data}</{field.name}>', 3)
+    def write_field_begin(self, field, value):
+        self._write(f'<{field.name}>{value}</{field.name}>', 3)
 
 
 class MetaDataWriter(BaseXmlDataWriter):
@@ -174,10 +408,9 @@ class MetaDataWriter(BaseXmlDataWriter):
 
         self._write(f'</{sheet.name}>', 1)
 
-    def write_row_end(self, sheet, row_index, row_count):
+    def write_row_end(self, sheet, row_index, row_count, row):
         if not sheet.single:
-            row_id = sheet.key_field.value_data
-            self._ids.append(str(row_id))
+            self._ids.append(str(row.key))
 
 
 class MetaWithDescDataWriter(MetaDataWriter):
@@ -196,17 +429,16 @@ class MetaWithDescDataWriter(MetaDataWriter):
         self._ids.clear()
         self._current_desc = ''
 
-    def write_row_end(self, sheet, row_index, row_count):
+    def write_row_end(self, sheet, row_index, row_count, row):
         if not sheet.single:
-            row_id = sheet.key_field.value_data
-            id_data = (row_id, self._current_desc)
+            id_data = (row.key, self._current_desc)
             self._ids.append(id_data)
 
             self._current_desc = ''
 
-    def write_field_begin(self, field):
+    def write_field_begin(self, field, value):
         if field.name in ['desc', 'name', 'Desc', 'Name', 'Player_Name']:
-            self._current_desc = field.value_data
+            self._current_desc = value
 
 
 class IDsDataWriter(MetaWithDescDataWriter):
@@ -43,13 +43,14 @@ class SheetField(StructField):
     def value_map_names(self):
         return self._value_map_names
 
-    def update_value_map_data(self):
+    def convert_value_map_data(self, values):
+        # values: 字段 -> 这一行已经转换好的值
         data_map = {}
         for f in self._value_map_fields:
-            data_map[f.name] = f'{f.value_data}'
+            data_map[f.name] = f'{values.get(f, None)}'
 
         data_str = Template(self._value_map).substitute(data_map)
-        return self.set_data(data_str)
+        return self.convert_data(data_str)
 
     def parse_maps(self):
         if self._value_map and self._value_map != '':
@@ -1,36 +1,151 @@
 #! python 3
 # -*- coding: utf_8 -*-
 
+import os
 import re
+import stat
+import struct
+import tempfile
+import functools
 from .field import SheetField
 from .base import BaseCode
 import core.xlproc as xlc
+import core.numeric as numeric
 from core.parser import TypeParser
 from .code_utils import load_define_data, load_maps
-from core.code import GCodeTypeMap
+from core.code import GCodeTypeMap, RowData
+from core.check import Eval
 from core.utils import *
 
 sign_re = re.compile(r'^(\w+)<(\w+.*?)>(?:[:](\d+))?$', re.S)
 
 
+@functools.lru_cache(maxsize=4096)
+def match_sign(cell):
+    return sign_re.match(cell)
+
+
 def sign_verify(cell):
-    return isinstance(cell, str) and sign_re.match(cell)
+    # 数据中的大部分字符串不包含 <，不需要使用正则匹配
+    return isinstance(cell, str) and '<' in cell and match_sign(cell)
 
 
 class DataStream:
     def __init__(self):
-        self._data_bytes = b''
+        # bytearray追加是均摊O(1)的，bytes相加每次都要复制全部数据
+        self._data_bytes = bytearray()
 
     def write(self, data_bytes):
         self._data_bytes += data_bytes
 
     @property
     def data_bytes(self):
-        return self._data_bytes
+        return bytes(self._data_bytes)
 
     @property
     def length(self):
-        return len(self.data_bytes)
+        return len(self._data_bytes)
+
+    def reserve_int(self):
+        pos = len(self._data_bytes)
+        self._data_bytes += b'\0\0\0\0'
+        return pos
+
+    def patch_int(self, pos, value):
+        self._data_bytes[pos:pos + 4] = struct.pack('<i', value)
+
+
+def _get_default_file_mode():
+    # umask只能通过设置来读取，import时读取一次，之后不再修改进程的umask
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+_default_file_mode = _get_default_file_mode()
+
+
+class FileDataStream:
+    """数据直接写入临时文件，close时替换目标文件，不在内存中保存全部数据"""
+
+    def __init__(self, file_name):
+        self._file_name = file_name
+        # 每个流使用不同的临时文件，在目标目录中创建，保证os.replace不跨文件系统
+        dir_name, base_name = os.path.split(os.path.abspath(file_name))
+        fd, self._temp_file_name = tempfile.mkstemp(prefix=f'{base_name}.', suffix='.tmp', dir=dir_name)
+        self._fp = os.fdopen(fd, 'wb', buffering=1024 * 1024)
+
+    def write(self, data_bytes):
+        self._fp.write(data_bytes)
+
+    @property
+    def length(self):
+        return self._fp.tell()
+
+    def reserve_int(self):
+        # 先写入占位的int，返回位置，长度确定后再用patch_int回填
+        pos = self._fp.tell()
+        self._fp.write(b'\0\0\0\0')
+        return pos
+
+    def patch_int(self, pos, value):
+        end = self._fp.tell()
+        self._fp.seek(pos)
+        self._fp.write(struct.pack('<i', value))
+        self._fp.seek(end)
+
+    def close(self):
+        self._fp.close()
+        # mkstemp创建的文件只有当前用户可以读写，改为目标文件原来的权限，没有目标文件时和直接创建的文件一样
+        try:
+            mode = stat.S_IMODE(os.stat(self._file_name).st_mode)
+        except OSError:
+            mode = _default_file_mode
+        os.chmod(self._temp_file_name, mode)
+        os.replace(self._temp_file_name, self._file_name)
+
+    def abort(self):
+        # 写入失败时关闭并删除临时文件，原来的目标文件保持不变
+        self._fp.close()
+        try:
+            os.remove(self._temp_file_name)
+        except OSError:
+            pass
+
+
+class TestDataOverlay:
+    """一个字段的测试数据，从data.yml中预先整理为 主键 -> 值 和 all 默认值"""
+    SINGLE = 0  # 单行表，直接使用字段的测试数据
+    FIELD = 1  # 以字段为主，字段下面是 主键 -> 值，找不到时使用all
+    ROW = 2  # 以id为主，主键下面是 字段 -> 值
+
+    __slots__ = ('_mode', '_values', '_default', '_has_default')
+
+    def __init__(self, mode, values=None, default=None, has_default=False):
+        self._mode = mode
+        self._values = values
+        self._default = default
+        self._has_default = has_default
+
+    def get(self, key):
+        # 返回 (测试数据, 主键)，没有测试数据时返回 (None, 0)
+        if self._mode == TestDataOverlay.SINGLE:
+            return self._default, 0
+
+        if self._mode == TestDataOverlay.FIELD:
+            if key is None:
+                key = 0
+
+            if key and key in self._values:
+                return self._values[key], key
+
+            if self._has_default:
+                return self._default, key
+
+        elif key is not None and key in self._values:
+            return self._values[key], key
+
+        return None, 0
 
 
 class SheetRef:
@@ -130,12 +245,12 @@ class SubSheetCode:
             return
 
         n2d, _, _ = xlc.normalize_sheet(self._sheet, sign_verify, self._sheet_code.transpose)
-        cells = n2d[1:]
-
-        self._cell2d = cells
+        xlc.unload_sheet(self._sheet)
 
         if self._sheet_code.single:
-            self._cell2d = cells[:1]
+            self._cell2d = n2d.slice(1, 2)
+        else:
+            self._cell2d = n2d.slice(1)
 
 
 class SheetCode:
@@ -169,9 +284,11 @@ class SheetCode:
         self._single = False  # 是否是单行表
         self._transpose = False  # 是否转置
         self._fields_meta = {}
+        self._evals = []  # setting中的eval，检查整行数据
 
         # data
         self._test_data = None
+        self._test_overlay = {}  # 字段 -> TestDataOverlay，只包含有测试数据的字段
         self._test_data_new_rows = []
         if test_data and 'test_data' in test_data and 'update' in test_data['test_data']:
             test_data = test_data['test_data']['update']
@@ -194,6 +311,14 @@ class SheetCode:
     def book_name(self):
         return self._book_name
 
+    @property
+    def file_path(self):
+        return self._file_path
+
+    @property
+    def has_define(self):
+        return self._get_sheet('define') is not None
+
     @property
     def info(self):
         return f'{self._book_name}>{self.name}'
@@ -245,11 +370,14 @@ class SheetCode:
             return
 
         a2d = xlc.array2d(define_sheet)
+        xlc.unload_sheet(define_sheet)
+        xlc.release_book(define_sheet)
         TypeParser.parse(a2d)
 
     def load(self, bases):
         # 二次处理
         self._load()
+        xlc.release_book(self._sheet)
 
         if self._ignore:
             return
@@ -282,6 +410,8 @@ class SheetCode:
             self._base_info = bases[self._base_name]
             self._base_info.add_fields(self._sheet_name, self._fields)
 
+        self._compile_test_data()
+
     def process(self):
         self._process_base_info()
         self._process_define_fields()
@@ -291,45 +421,55 @@ class SheetCode:
             return self._meta_sheets[name]
         return None
 
-    def _get_test_data(self, field):
-        if not field:
-            return None, 0
+    def _compile_test_data(self):
+        # 只在加载时遍历一次data.yml，没有测试数据的字段写数据时不需要任何查找
+        self._test_overlay = {}
+        if not self._test_data or not isinstance(self._test_data, dict):
+            return
 
-        if not self.single and field == self._key_field:
-            return None, 0
+        for field in self._fields:
+            if not self.single and field == self._key_field:
+                continue
 
-        if not self._test_data or len(self._test_data) == 0:
-            return None, 0
+            if field.name not in self._test_data:
+                continue
 
-        if field.name not in self._test_data:
-            return None, 0
+            field_test_data = self._test_data[field.name]
+            # 以字段为主，然后再寻找id的方式
+            if field_test_data is not None:
+                if self.single:
+                    overlay = TestDataOverlay(TestDataOverlay.SINGLE, default=field_test_data, has_default=True)
+                elif isinstance(field_test_data, dict):
+                    overlay = TestDataOverlay(TestDataOverlay.FIELD, field_test_data, field_test_data.get('all', None),
+                                              'all' in field_test_data)
+                else:
+                    print(f'--- warning invalid test data {self.info}>{field.name}: {field_test_data}, ignore')
+                    continue
 
-        field_test_data = self._test_data[field.name]
-        field_current_key = self._key_field.value_data
-        # 以字段为主，然后再寻找id的方式
-        if field_test_data is not None:
-            if self.single:
-                return field_test_data, 0
+            # 以id为主，然后再寻找字段的方式，主键的数据为空时使用all
+            else:
+                all_test_data = self._test_data.get('all', None)
+                values = {}
+                for key, row_test_data in self._test_data.items():
+                    if row_test_data is None:
+                        row_test_data = all_test_data
 
-            if field_current_key is None:
-                field_current_key = 0
+                    if isinstance(row_test_data, dict) and field.name in row_test_data:
+                        values[key] = row_test_data[field.name]
 
-            if field_current_key and field_current_key in field_test_data:
-                return field_test_data[field_current_key], field_current_key
+                if len(values) == 0:
+                    continue
 
-            if 'all' in field_test_data:
-                return field_test_data['all'], field_current_key
+                overlay = TestDataOverlay(TestDataOverlay.ROW, values)
 
-        # 以id为主，然后再寻找字段的方式
-        elif field_current_key is not None and field_current_key in self._test_data:
-            row_test_data = self._test_data[field_current_key]
-            if row_test_data is None:
-                row_test_data = self._test_data['all']
+            self._test_overlay[field] = overlay
 
-            if row_test_data and field.name in row_test_data:
-                return row_test_data[field.name], field_current_key
+    def _get_test_data(self, field, field_current_key):
+        overlay = self._test_overlay.get(field, None)
+        if not overlay:
+            return None, 0
 
-        return None, 0
+        return overlay.get(field_current_key)
 
     def _load_define_data(self, define_data):
         fields = load_define_data(self, define_data)
@@ -347,12 +487,10 @@ class SheetCode:
         n2d, a2d, sign_pos = xlc.normalize_sheet(self._sheet, sign_verify, self._transpose)
 
         desc_list = a2d[sign_pos.r - 1]
-        title = n2d[0]
+        title = n2d.row_values(0)
 
-        for i, sign in enumerate(title):
-            (r, c, s) = sign
-
-            m = sign_re.match(s)
+        for i, s in enumerate(title):
+            m = match_sign(s)
             name = m[1]
             sign = m[2]
             position = (i + 1) * 10
@@ -389,6 +527,7 @@ class SheetCode:
             return
 
         setting_a2d = xlc.array2d(setting_sheet)
+        xlc.unload_sheet(setting_sheet)
         setting_rows = setting_a2d[1:]
         for row in setting_rows:
             key = get_list_value(row, 0, None)
@@ -409,6 +548,7 @@ class SheetCode:
             return
 
         meta_a2d = xlc.array2d(meet_sheet)
+        xlc.unload_sheet(meet_sheet)
         meta_rows = meta_a2d[1:]
         for row in meta_rows:
             if len(row) == 0:
@@ -435,6 +575,8 @@ class SheetCode:
             self._ignore = not is_valid_language(val)
         elif key == 'base':
             self._base_name = val
+        elif key == 'eval':
+            self._evals.append(Eval(str(val)))
 
     def _load_test_data(self, cell2d):
         if not self._test_data or 'new' not in self._test_data:
@@ -443,8 +585,7 @@ class SheetCode:
         if len(cell2d) <= 0:
             return
 
-        last_row = cell2d[-1]
-        last_row_index, _, _ = last_row[0]
+        last_row_index = cell2d.rows[-1]
 
         new_row_count = 0
         row_index = last_row_index + 1
@@ -459,110 +600,264 @@ class SheetCode:
             if not row or len(row) == 0:
                 continue
 
-            row = [(row_index, i, value) for i, value in enumerate(row)]
-            cell2d.append(row)
-            self._test_data_new_rows.append(row)
+            cell2d.append_row(row_index, row)
+            self._test_data_new_rows.append([(row_index, i, value) for i, value in enumerate(row)])
             new_row_count += 1
             row_index += 1
 
         if new_row_count > 0:
             print(f'new row {new_row_count}')
 
-    def write_data(self, writer, show_test_data=True):
-        for sub_sheet in self._sub_sheets:
-            cell2d = sub_sheet.cell2d
+    @property
+    def index_sheet_names(self):
+        # index检查引用的其他表
+        names = {field.check_setting.index.sheet_name for field in self._fields if field.check_setting.index}
+        names.discard(self.name)
+        return sorted(names)
 
-            row_len = len(cell2d)
-            writer.write_sheet_begin(sub_sheet, row_len)
+    def get_field(self, name):
+        for field in self._fields:
+            if field.name == name:
+                return field
 
-            key_ids = []
+        return None
 
-            for i, row in enumerate(cell2d):
-                for field in self._fields:
-                    if field.only_define or field.is_value_map:
-                        continue
+    def build_index(self, field_name, errors=None):
+        # 被引用的列中所有值的set，和写数据时一样使用测试数据，每个单元格只转换一次
+        # errors 不为None时跳过不能转换的单元格并记录错误，否则在第一个错误时抛出异常
+        field = self.get_field(field_name)
+        if not field or field.only_define or field.is_value_map:
+            raise Exception(f'sheet info: {self.info}, invalid index field {field_name}')
 
-                    column_index = field.column_index
-                    (r, c, data) = row[column_index]
+        overlay = self._test_overlay.get(field, None)
+        key_field = self._key_field
+        read_key = overlay and key_field is not field and not key_field.is_value_map
+        current_key = None
 
-                    field_test_data, field_key = self._get_test_data(field)
+        values = set()
+        for sub_sheet in self._sub_sheets:
+            columns = sub_sheet.cell2d.columns
+            for i, data in enumerate(columns[field.column_index]):
+                if overlay:
+                    if read_key:
+                        _, _, key = key_field.convert_data(columns[key_field.column_index][i])
+                        if key is not None:
+                            current_key = key
+
+                    field_test_data, _ = overlay.get(current_key)
                     if field_test_data is not None:
                         data = field_test_data
-                        if show_test_data:
-                            print(f'test_data: {sub_sheet.info}>{field.name},{field_key}: {field_test_data}')
 
-                    ok, info = field.set_data(data)
-                    if not ok:
-                        raise Exception(f'sheet info: {sub_sheet.info}>{field.name},{i}: {info}')
+                ok, info, value = field.convert_data(data)
+                if not ok:
+                    error = f'sheet info: {sub_sheet.info}>{field.name},{i}: {info}'
+                    if errors is None:
+                        raise Exception(error)
+                    errors.append(error)
+                    continue
+
+                if value.__hash__:
+                    values.add(value)
+
+        return values
+
+    def _compile_evals(self, row_fields):
+        # 每个表编译一次，表达式按下标读取这一行的值，用到没有写入的字段时才需要额外的值
+        evals = [(self.name, e) for e in self._evals]
+        evals.extend([(field.name, field.check_setting.eval) for field in self._fields
+                      if field.check_setting.eval and not field.only_define])
+        if len(evals) == 0:
+            return [], []
+
+        names = set()
+        for _, e in evals:
+            names |= e.names
+
+        extra_fields = [field for field in self._fields
+                        if field.in_value_map and not field.only_define and field.name in names]
+        eval_names = [field.name for field in row_fields + extra_fields]
+        for name, e in evals:
+            try:
+                e.compile(eval_names)
+            except Exception as ex:
+                raise Exception(f'sheet info: {self.info}>{name}: {ex}')
+
+        return evals, extra_fields
+
+    def write_data(self, writer, show_test_data=True, errors=None):
+        # errors 不为None时收集所有错误，不在第一个错误时抛出异常，出错的行不写入
+        def report(error):
+            if errors is None:
+                raise Exception(error)
+            errors.append(error)
+
+        row_fields = [field for field in self._fields if not field.only_define and not field.in_value_map]
+        index_fields = [field for field in self._fields if field.check_setting.index and not field.only_define]
+        evals, eval_extra_fields = self._compile_evals(row_fields)
+        check_errors = []
+        test_overlay = self._test_overlay
+
+        # 主键字段还没有转换时，和之前一样使用上一行的主键查找测试数据
+        current_key = None
 
-                for field in self._maps_fields:
-                    ok, info = field.update_value_map_data()
-                    if not ok:
-                        raise Exception(f'sheet info: {sub_sheet.info}>{field.name},{i}: {info}')
+        for sub_sheet in self._sub_sheets:
+            cell2d = sub_sheet.cell2d
 
-                key_id = sub_sheet.key_field.value_data
-                if key_id in key_ids:
-                    raise Exception(f'sheet info: {sub_sheet.info}>row {i}: repeat key id {key_id}')
-                else:
-                    key_ids.append(key_id)
+            row_len = len(cell2d)
+            writer.write_sheet_begin(sub_sheet, row_len)
+
+            key_ids = set()
+            unhashable_key_ids = []  # 不能hash的主键只能逐个比较
+            columns = cell2d.columns
 
-                writer.write_row_begin(sub_sheet, i, row_len)
+            numeric_columns = {}
+            if numeric.UseNumpy:
+                numeric_columns = numeric.convert_columns(row_fields, cell2d)
+                writer.write_numeric_columns(sub_sheet, row_fields, numeric_columns)
 
+            test_data_lines = []  # 使用的测试数据，每个子表打印一次
+            for i in range(row_len):
+                is_numeric_row = True
+                row_ok = True
+                values = {}  # 字段 -> 转换好的值
                 for field in self._fields:
-                    if field.only_define or field.in_value_map:
+                    if field.only_define or field.is_value_map:
                         continue
-                    writer.write_field_begin(field)
-                    writer.write_field_end(field)
 
-                writer.write_row_end(sub_sheet, i, row_len)
+                    data = columns[field.column_index][i]
+                    value = None
+
+                    field_test_data = None
+                    if test_overlay and field in test_overlay:
+                        field_test_data, field_key = test_overlay[field].get(current_key)
+
+                    if field_test_data is not None:
+                        data = field_test_data
+                        is_numeric_row = False
+                        if show_test_data:
+                            test_data_lines.append(f'test_data: {sub_sheet.info}>{field.name},{field_key}: {field_test_data}')
+                    elif field in numeric_columns:
+                        value = numeric_columns[field].values[i]
+                        if value is None:
+                            # 转换或检查失败，逐个转换得到错误信息
+                            is_numeric_row = False
+
+                    if value is None:
+                        ok, info, value = field.convert_data(data)
+                        if not ok:
+                            report(f'sheet info: {sub_sheet.info}>{field.name},{i}: {info}')
+                            row_ok = False
+                            continue
+
+                    values[field] = value
+                    if field == self._key_field:
+                        current_key = value
+
+                if row_ok:
+                    for field in self._maps_fields:
+                        ok, info, values[field] = field.convert_value_map_data(values)
+                        if not ok:
+                            report(f'sheet info: {sub_sheet.info}>{field.name},{i}: {info}')
+                            row_ok = False
+                            break
+                        if field == self._key_field:
+                            current_key = values[field]
+
+                # 出错的行主键转换成功时也要记录，检查后面的行是否重复
+                key_id = current_key
+                if row_ok or self._key_field in values:
+                    seen_key_ids = key_ids if key_id.__hash__ else unhashable_key_ids
+                    if key_id in seen_key_ids:
+                        report(f'sheet info: {sub_sheet.info}>row {i}: repeat key id {key_id}')
+                        row_ok = False
+                    elif key_id.__hash__:
+                        key_ids.add(key_id)
+                    else:
+                        unhashable_key_ids.append(key_id)
+
+                if not row_ok:
+                    continue
+
+                for field in index_fields:
+                    index = field.check_setting.index
+                    try:
+                        for v in field.index_values(values[field]):
+                            if not index.check(v):
+                                check_errors.append(f'{sub_sheet.info}>{field.name},{i}: {v} not in {index}')
+                    except Exception as e:
+                        raise Exception(f'sheet info: {sub_sheet.info}>{field.name},{i}: {e}')
+
+                row = RowData([values[field] for field in row_fields], key_id)
+                if len(evals) > 0:
+                    eval_values = row.values
+                    if len(eval_extra_fields) > 0:
+                        eval_values += tuple(values[field] for field in eval_extra_fields)
+
+                    for name, e in evals:
+                        try:
+                            ok, info = e.check(eval_values), ''
+                        except Exception as ex:
+                            ok, info = False, f', {ex}'
+                        if not ok:
+                            check_errors.append(f'{sub_sheet.info}>{name},{i}: eval failed, {e}{info}')
+
+                writer.write_row_begin(sub_sheet, i, row_len, row)
+                writer.write_row_fields(sub_sheet, row_fields, row, i if is_numeric_row else None)
+                writer.write_row_end(sub_sheet, i, row_len, row)
+
+            if len(test_data_lines) > 0:
+                print('\n'.join(test_data_lines))
 
             writer.write_sheet_end(sub_sheet)
 
-    def update_data(self):
-        if not self._test_data or len(self._test_data) == 0:
-            return
+        # 整个表检查完后一起报告所有不存在的索引和eval检查失败的行
+        if errors is not None:
+            errors.extend(check_errors)
+        elif len(check_errors) > 0:
+            lines = '\n'.join(check_errors)
+            raise Exception(f'sheet info: {self.info}: {len(check_errors)} check failed\n{lines}')
 
-        import openpyxl as xl
-        wb = xl.load_workbook(filename=self._file_path)
-        if self.name not in wb:
-            return
+    def get_update_data(self):
+        # 从已经读取的表格数据中找出需要修改的单元格，返回 [(子表名, 行, 列, 数据)]，行列从1开始
+        cells = []
+        if not self._test_data or len(self._test_data) == 0:
+            return cells
 
-        is_modify = False
+        current_key = None
 
         for sub_sheet in self._sub_sheets:
             cell2d = sub_sheet.cell2d
+            columns = cell2d.columns
 
-            wb_sheet = wb[sub_sheet.name]
-
-            for i, row in enumerate(cell2d):
+            for i in range(len(cell2d)):
                 for field in self._fields:
                     if field.only_define or field.is_value_map:
                         continue
 
                     column_index = field.column_index
-                    (r, c, data) = row[column_index]
+                    data = columns[column_index][i]
                     if field == self._key_field:
-                        field.set_data(data)
+                        _, _, target = field.convert_data(data)
+                        if target is not None:
+                            current_key = target
                         continue
 
-                    field_test_data, field_key = self._get_test_data(field)
+                    field_test_data, field_key = self._get_test_data(field, current_key)
                     if field_test_data is None:
                         continue
 
                     data = field_test_data
                     print(f'update test_data: {sub_sheet.info}>{field.name},{field_key}: {field_test_data}')
-                    wb_sheet.cell(r + 1, c + 1, data)
-                    is_modify = True
+                    r, c = cell2d.coordinate(i, column_index)
+                    cells.append((sub_sheet.name, r + 1, c + 1, data))
 
             for row in self._test_data_new_rows:
                 print(f'new row: {sub_sheet.info}: {row}')
                 for row_value in row:
                     r, c, data = row_value
-                    wb_sheet.cell(r + 1, c + 1, data)
-                    is_modify = True
+                    cells.append((sub_sheet.name, r + 1, c + 1, data))
 
-        if is_modify:
-            wb.save(self._file_path)
+        return cells
 
     def _process_base_info(self):
         if not self._base_info:
@@ -584,6 +879,7 @@ class AllCode:
         self._singles = []
         self._not_singles = []
         self._namespace = namespace
+        self._define_files = []
 
         print(define_file)
         self._defines = load_yaml_data(define_file)
@@ -599,6 +895,8 @@ class AllCode:
         for sheet in sheets:
             print(f'load define: {sheet.info}')
             sheet.load_define(self._defines)
+            if sheet.has_define:
+                self._define_files.append(sheet.file_path)
 
         for sheet in sheets:
             print(f'load excel data: {sheet.info}')
@@ -620,6 +918,43 @@ class AllCode:
             else:
                 self._singles.append(sheet)
 
+        self._indexes_built = False
+
+    def build_indexes(self, errors=None):
+        # 在写数据或者检查之前创建所有被引用的列的索引，只创建一次，多个字段引用同一列时共用一个索引
+        # errors 不为None时收集所有错误，不能创建的索引不检查
+        if self._indexes_built:
+            return
+
+        sheets = {sheet.name: sheet for sheet in self._sheets}
+        indexes = {}
+        for sheet in self._sheets:
+            for field in sheet.fields:
+                index = field.check_setting.index
+                if not index:
+                    continue
+
+                index_sheet = sheets.get(index.sheet_name, None)
+                if not index_sheet:
+                    print(f'--- warning index sheet {index.sheet_name} is not loaded, skip check, field {field.info}')
+                    continue
+
+                field_name = index.field_name or index_sheet.key_field.name
+                index_key = (index.sheet_name, field_name)
+                if index_key not in indexes:
+                    print(f'build index: {index_sheet.info}>{field_name}')
+                    try:
+                        indexes[index_key] = index_sheet.build_index(field_name, errors)
+                    except Exception as e:
+                        if errors is None:
+                            raise
+                        errors.append(str(e))
+                        indexes[index_key] = None
+
+                index.set_values(indexes[index_key])
+
+        self._indexes_built = True
+
     @property
     def sheets(self):
         return self._sheets
@@ -628,6 +963,10 @@ class AllCode:
     def bases(self):
         return self._bases
 
+    @property
+    def define_files(self):
+        return self._define_files
+
     @property
     def enums(self):
         return GCodeTypeMap.enums
@@ -4,19 +4,38 @@
 import os
 import sys
 import argparse
+import contextlib
 import glob
+import io
+import fnmatch
+import multiprocessing
+import traceback
 import xlrd
+from concurrent.futures import ProcessPoolExecutor
 from mako.template import Template
 
 import core.type as tp
+import core.numeric as numeric
+import core.xlproc as xlc
+import core.xlsx_reader as xlsx
+from core.book_cache import BookCache, get_file_hash
+from core.code import GCodeTypeMap
 from core.git_version import GitVersion
 from core.sign_map import load_sign_map
+from core.watcher import FileWatcher
 from excel_code.sheet import SheetRef, AllCode
 from excel_code.data_writer import SimpleBinDataWriter, ThriftBinDataWriter, XmlDataWriter
 from excel_code.data_writer import MetaDataWriter, MetaWithDescDataWriter, IDsDataWriter
+from excel_code.data_writer import ThriftBinDataReader, DataManifest, MultiDataWriter, BaseDataWriter
 
 _languages = ['cpp', 'csharp']
 
+_incremental_data_version = 1
+
+_template_cache = {}
+_parallel_all_code = None  # 并行写数据和检查时，子进程从这里取得all_code
+_worker_convert_cache_stats = [0, 0]  # 子进程中转换缓存的命中和未命中次数，打印时加到当前进程的统计中
+
 if getattr(sys, 'frozen', False):
     cwd = os.path.dirname(sys.executable)
 else:
@@ -41,9 +60,88 @@ _writer_file_name = {
 }
 
 
-def load_sheet_refs(folder, subdir):
+def is_data_sheet(name):
+    return not name.startswith('Sheet') and not name.startswith('$')
+
+
+def load_book(file, native_xlsx=False):
+    if native_xlsx and xlsx.is_xlsx_file(file):
+        return xlsx.read_book(file, is_data_sheet)
+
+    with xlrd.open_workbook(file, ragged_rows=True) as book:
+        return [sheet for sheet in book.sheets() if is_data_sheet(sheet.name)]
+
+
+def get_book_sheet_names(file):
+    # 只读取sheet名字，不加载表格数据
+    if xlsx.is_xlsx_file(file):
+        return xlsx.read_sheet_names(file)
+
+    with xlrd.open_workbook(file, on_demand=True) as book:
+        return book.sheet_names()
+
+
+def is_sheet_selected(sheet_name, sheet_patterns):
+    return any(fnmatch.fnmatchcase(sheet_name, pattern) for pattern in sheet_patterns)
+
+
+def select_sheet_files(files, sheet_patterns):
+    # 只保留包含选中表的excel，以及包含define定义的excel
+    selected_files = []
+    for file in files:
+        names = [name for name in get_book_sheet_names(file) if is_data_sheet(name)]
+        if len(names) == 0:
+            continue
+
+        if is_sheet_selected(names[0], sheet_patterns):
+            selected_files.append(file)
+        elif 'define' in names:
+            print(f'define dependency: {file}')
+            selected_files.append(file)
+
+    return selected_files
+
+
+def open_lazy_book(file):
+    # 只读取sheet名字，sheet在使用时才加载
+    book = xlc.LazyBook(file, not xlsx.is_xlsx_file(file))
+    names = [name for name in get_book_sheet_names(file) if is_data_sheet(name)]
+    return [xlc.LazySheet(book, name) for name in names]
+
+
+def load_book_data(file, native_xlsx=False):
+    # 在子进程中执行，返回可以pickle的表格数据
+    return [xlc.SheetData(sheet.name, xlc.array2d(sheet)) for sheet in load_book(file, native_xlsx)]
+
+
+def load_books(files, jobs, book_cache=None, native_xlsx=False, lazy=True):
+    is_parallel = jobs and jobs > 1
+    if not book_cache and not is_parallel and lazy:
+        return [load_book(file, native_xlsx) if native_xlsx and xlsx.is_xlsx_file(file) else open_lazy_book(file)
+                for file in files]
+
+    books = [book_cache.get(file) if book_cache else None for file in files]
+    missing_files = [file for file, sheets in zip(files, books) if sheets is None]
+    if book_cache:
+        print(f'excel cache hit {book_cache.hit_count}, miss {book_cache.miss_count}')
+
+    if is_parallel and len(missing_files) > 1:
+        print(f'load excels with {jobs} jobs')
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            loaded_books = list(executor.map(load_book_data, missing_files, [native_xlsx] * len(missing_files)))
+    else:
+        loaded_books = [load_book_data(file, native_xlsx) for file in missing_files]
+
+    loaded_map = dict(zip(missing_files, loaded_books))
+    if book_cache:
+        for file, sheets in loaded_map.items():
+            book_cache.put(file, sheets)
+
+    return [loaded_map[file] if sheets is None else sheets for file, sheets in zip(files, books)]
+
+
+def find_excel_files(folder, subdir):
     wildcard = os.path.join(folder, '*.xls*')
-    sheet_refs = []
 
     subdir_path = None
     if subdir is not None and subdir != '':
@@ -78,25 +176,39 @@ def load_sheet_refs(folder, subdir):
 
             files.append(file)
 
-    for file in files:
-        _, filename = os.path.split(file)
-        with xlrd.open_workbook(file, ragged_rows=True) as book:
-            sheets = []
-            for sheet in book.sheets():
-                if sheet.name.startswith('Sheet') or sheet.name.startswith('$'):
-                    continue
+    return files
 
-                sheets.append(sheet)
 
-            if len(sheets) > 0:
-                sheet_refs.append(SheetRef(file, filename, sheets))
+def load_file_sheet_refs(files, jobs=0, book_cache=None, native_xlsx=False, lazy=True):
+    # 返回和files一一对应的SheetRef，没有数据表的excel为None
+    sheet_refs = []
+    books = load_books(files, jobs, book_cache, native_xlsx, lazy)
+    for file, sheets in zip(files, books):
+        _, filename = os.path.split(file)
+        if len(sheets) > 0:
+            sheet_refs.append(SheetRef(file, filename, sheets))
+        else:
+            sheet_refs.append(None)
 
     return sheet_refs
 
 
-def load_excel_files(excel_dir, subdir):
+def load_sheet_refs(folder, subdir, jobs=0, cache_dir=None, native_xlsx=False, sheet_patterns=None):
+    files = find_excel_files(folder, subdir)
+    if sheet_patterns:
+        files = select_sheet_files(files, sheet_patterns)
+
+    book_cache = None
+    if cache_dir:
+        book_cache = BookCache(cache_dir)
+
+    sheet_refs = load_file_sheet_refs(files, jobs, book_cache, native_xlsx)
+    return [sheet_ref for sheet_ref in sheet_refs if sheet_ref]
+
+
+def load_excel_files(excel_dir, subdir, jobs=0, cache_dir=None, native_xlsx=False, sheet_patterns=None):
     print('/> load excels ...')
-    sheet_refs = load_sheet_refs(excel_dir, subdir)
+    sheet_refs = load_sheet_refs(excel_dir, subdir, jobs, cache_dir, native_xlsx, sheet_patterns)
     if len(sheet_refs) <= 0:
         raise Exception(f'can not find excels in dir : {excel_dir}')
 
@@ -112,24 +224,352 @@ def load_sheets(sheet_refs, define_file, test_data, namespace):
     return all_code
 
 
+def create_data_writer(writer_name, filepath):
+    if writer_name not in _writer_type:
+        raise Exception(f'invalid writer_type {writer_name}, support {_writer_type.keys()}')
+
+    return _writer_type[writer_name](filepath)
+
+
 def write_data(all_code, filepath, git_version, writer_name, show_test_data):
+    writer = create_data_writer(writer_name, filepath)
+    write_data_with(all_code, writer, git_version, show_test_data)
+
+
+def create_parallel_executor(all_code, jobs):
+    # 子进程需要fork得到父进程中的all_code，不能fork(windows)时返回None，在当前进程中执行
+    # spawn出的子进程要重新读取所有excel，比在当前进程中执行还慢，excel修改后读到的数据也可能不一致
+    global _parallel_all_code
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+
+    _parallel_all_code = all_code
+    return ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork'))
+
+
+def get_parallel_sheet(sheet_index, sheet_name):
+    sh = _parallel_all_code.sheets[sheet_index]
+    if sh.name != sheet_name:
+        raise Exception(f'sheet {sheet_name} is not loaded in sub process, found {sh.name}')
+
+    return sh
+
+
+@contextlib.contextmanager
+def writing_data(writer):
+    # write_begin到write_file之间出错时删除临时文件，不留下写了一半的数据文件
+    try:
+        writer.write_begin()
+        yield writer
+        writer.write_end()
+        writer.write_file()
+    except BaseException:
+        writer.write_abort()
+        raise
+
+
+def write_data_multi(all_code, writer_files, git_version, show_test_data, jobs=0):
+    # writer_files: [(writer_name, filepath)]，所有writer在一次遍历中写入，每行数据只转换一次
+    writers = [create_data_writer(writer_name, filepath) for writer_name, filepath in writer_files]
+    writer = MultiDataWriter(writers)
+
+    if jobs and jobs > 1 and len(all_code.sheets) > 1:
+        writer_names = [writer_name for writer_name, _ in writer_files]
+        if write_data_parallel(all_code, writer, writer_names, git_version, show_test_data, jobs):
+            return
+
+        print('--- warning write data with jobs needs fork, write data in current process')
+
+    write_data_with(all_code, writer, git_version, show_test_data)
+
+
+def write_sheet_section(sheet_index, sheet_name, writer_names, show_test_data):
+    # 在子进程中执行，返回打印的内容、每个writer的表数据和错误信息
+    sh = get_parallel_sheet(sheet_index, sheet_name)
+    writer = MultiDataWriter([create_data_writer(writer_name, None) for writer_name in writer_names])
+
+    cache_start = get_convert_cache_stats()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            writer.begin_section()
+            sh.write_data(writer, show_test_data)
+            section = writer.end_section()
+        except Exception as e:
+            return output.getvalue(), None, str(e), get_convert_cache_stats(cache_start)
+
+    return output.getvalue(), section, None, get_convert_cache_stats(cache_start)
+
+
+def write_data_parallel(all_code, writer, writer_names, git_version, show_test_data, jobs):
+    # 不能创建子进程时返回False
+    global _parallel_all_code
+
+    sheet_count = len(all_code.sheets)
+    sheet_names = [sh.name for sh in all_code.sheets]
+    all_code.build_indexes()
+    try:
+        executor = create_parallel_executor(all_code, jobs)
+        if not executor:
+            return False
+
+        version = git_version.Version
+        if show_test_data:
+            print(f'data version is: {version}')
+        print(f'write data with {jobs} jobs')
+
+        with executor:
+            # 先提交任务创建子进程，再打开数据文件，子进程不会继承文件缓冲区
+            results = executor.map(write_sheet_section, range(sheet_count), sheet_names,
+                                   [writer_names] * sheet_count, [show_test_data] * sheet_count)
+
+            with writing_data(writer):
+                writer.write_version(version)
+
+                # 按all_code.sheets的顺序写入，和在当前进程中写入的结果一样
+                for output, section, error, cache_stats in results:
+                    print(output, end='')
+                    add_worker_convert_cache_stats(cache_stats)
+                    if error is not None:
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        raise Exception(error)
+
+                    writer.write_section(section)
+    finally:
+        _parallel_all_code = None
+
+    return True
+
+
+def write_data_with(all_code, writer, git_version, show_test_data):
     version = git_version.Version
     if show_test_data:
         print(f'data version is: {version}')
 
-    if writer_name not in _writer_type:
-        raise Exception(f'invalid writer_type {writer_name}, support {_writer_type.keys()}')
+    all_code.build_indexes()
+    with writing_data(writer):
+        writer.write_version(version)
 
-    writer = _writer_type[writer_name](filepath)
+        for sh in all_code.sheets:
+            sh.write_data(writer, show_test_data)
 
-    writer.write_begin()
-    writer.write_version(version)
 
-    for sh in all_code.sheets:
-        sh.write_data(writer, show_test_data)
+def check_sheet(sh):
+    # 只转换和检查数据，不写入文件，返回这个表的所有错误
+    errors = []
+    try:
+        sh.write_data(BaseDataWriter(None), False, errors)
+    except Exception as e:
+        errors.append(str(e))
+
+    return errors
+
+
+def check_sheet_section(sheet_index, sheet_name):
+    # 在子进程中执行，返回打印的内容、错误信息和转换缓存的统计
+    cache_start = get_convert_cache_stats()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        errors = check_sheet(get_parallel_sheet(sheet_index, sheet_name))
+
+    return output.getvalue(), errors, get_convert_cache_stats(cache_start)
+
+
+def check_data(all_code, jobs=0):
+    global _parallel_all_code
+
+    # 被引用的列中不能转换的单元格也作为检查错误报告
+    index_errors = []
+    all_code.build_indexes(index_errors)
+
+    results = None
+    sheet_count = len(all_code.sheets)
+    if jobs and jobs > 1 and sheet_count > 1:
+        try:
+            executor = create_parallel_executor(all_code, jobs)
+            if executor:
+                print(f'check data with {jobs} jobs')
+                with executor:
+                    results = list(executor.map(check_sheet_section, range(sheet_count),
+                                                [sh.name for sh in all_code.sheets]))
+            else:
+                print('--- warning check data with jobs needs fork, check data in current process')
+        finally:
+            _parallel_all_code = None
+
+    if results is None:
+        results = [('', check_sheet(sh), (0, 0)) for sh in all_code.sheets]
+
+    errors = index_errors
+    for output, sheet_errors, cache_stats in results:
+        print(output, end='')
+        errors.extend(sheet_errors)
+        add_worker_convert_cache_stats(cache_stats)
+
+    # 被引用的表自己检查时会再报告一次同样的错误
+    return list(dict.fromkeys(errors))
+
+
+def check_all(all_code, jobs=0):
+    print('/> checking data ...')
+    errors = check_data(all_code, jobs)
+    for error in errors:
+        print(error)
+
+    print_convert_cache_stats()
+    if len(errors) > 0:
+        raise Exception(f'check data failed, {len(errors)} errors')
+
+    print('/> check data passed')
+
+
+def get_data_global_hash(all_code, define_file, test_data, language):
+    # 会影响所有表数据的内容：定义文件、测试数据、编码以及所有包含define的excel
+    hash_list = [f'{_incremental_data_version}', language, tp.StringEncodingOfPack,
+                 get_file_hash(os.path.join(cwd, define_file))]
 
-    writer.write_end()
-    writer.write_file()
+    if test_data and os.path.exists(test_data):
+        hash_list.append(get_file_hash(test_data))
+
+    if tp.PackRunLength:
+        hash_list.append('run_length')
+
+    for file in sorted(all_code.define_files):
+        hash_list.append(get_file_hash(file))
+
+    return '|'.join(hash_list)
+
+
+def load_prev_sections(filepath, manifest, global_hash):
+    if manifest.global_hash != global_hash:
+        print('data global hash changed, rebuild all data')
+        return {}
+
+    if not os.path.exists(filepath) or manifest.data_hash != get_file_hash(filepath):
+        print(f'data file changed: {filepath}, rebuild all data')
+        return {}
+
+    try:
+        return ThriftBinDataReader(filepath).read()
+    except Exception as e:
+        print(f'--- warning read data file failed: {filepath}, rebuild all data, {e}')
+        return {}
+
+
+def get_sheet_data_hash(all_code, sh, file_hashes):
+    # 表的数据只和自己的excel有关，index检查还和引用的表有关，引用的表修改后也要重新检查
+    def file_hash(file_path):
+        if file_path not in file_hashes:
+            file_hashes[file_path] = get_file_hash(file_path)
+        return file_hashes[file_path]
+
+    sheet_hash = file_hash(sh.file_path)
+    index_sheet_names = sh.index_sheet_names
+    if len(index_sheet_names) == 0:
+        return sheet_hash
+
+    sheets = {index_sheet.name: index_sheet for index_sheet in all_code.sheets}
+    index_hashes = []
+    for name in index_sheet_names:
+        index_sheet = sheets.get(name, None)
+        index_hashes.append(f'{name}:{file_hash(index_sheet.file_path) if index_sheet else ""}')
+
+    return ','.join([sheet_hash] + index_hashes)
+
+
+def write_data_incremental(all_code, filepath, git_version, global_hash):
+    version = git_version.Version
+    print(f'data version is: {version}')
+
+    prev_manifest = DataManifest(f'{filepath}.manifest')
+    prev_manifest.load()
+    sections = load_prev_sections(filepath, prev_manifest, global_hash)
+
+    manifest = DataManifest(f'{filepath}.manifest')
+    manifest.global_hash = global_hash
+
+    all_code.build_indexes()
+    writer = ThriftBinDataWriter(filepath)
+    copied_count = 0
+    file_hashes = {}
+    with writing_data(writer):
+        writer.write_version(version)
+
+        for sh in all_code.sheets:
+            book_hash = get_sheet_data_hash(all_code, sh, file_hashes)
+            manifest.sheets[sh.name] = book_hash
+
+            is_unchanged = prev_manifest.sheets.get(sh.name, None) == book_hash
+            if is_unchanged and all(sub_sheet.name in sections for sub_sheet in sh.sub_sheets):
+                for sub_sheet in sh.sub_sheets:
+                    row_len, data_bytes = sections[sub_sheet.name]
+                    writer.write_sheet_bytes(sub_sheet.name, row_len, data_bytes)
+                copied_count += 1
+                continue
+
+            print(f'rebuild data: {sh.info}')
+            sh.write_data(writer, True)
+
+    manifest.data_hash = get_file_hash(filepath)
+    manifest.save()
+    print(f'incremental data: copy {copied_count}, rebuild {len(all_code.sheets) - copied_count}')
+
+
+def write_data_partial(all_code, filepath, git_version, sheet_patterns):
+    version = git_version.Version
+    print(f'data version is: {version}')
+
+    sheets = [sh for sh in all_code.sheets if is_sheet_selected(sh.name, sheet_patterns)]
+    if len(sheets) == 0:
+        raise Exception(f'can not find sheets : {sheet_patterns}')
+
+    # 已有的数据文件中只替换选中的表，没有数据文件时只写入选中的表
+    sections = {}
+    if os.path.exists(filepath):
+        try:
+            sections = ThriftBinDataReader(filepath).read()
+        except Exception as e:
+            raise Exception(f'read data file failed: {filepath}, {e}')
+    else:
+        print(f'--- warning data file not exists, write partial data: {filepath}')
+
+    sub_sheet_map = {}
+    for sh in sheets:
+        for sub_sheet in sh.sub_sheets:
+            sub_sheet_map[sub_sheet.name] = sh
+
+    all_code.build_indexes()
+    writer = ThriftBinDataWriter(filepath)
+    with writing_data(writer):
+        writer.write_version(version)
+
+        written_sheets = []
+        for name, (row_len, data_bytes) in sections.items():
+            sh = sub_sheet_map.get(name, None)
+            if not sh:
+                writer.write_sheet_bytes(name, row_len, data_bytes)
+                continue
+
+            if sh not in written_sheets:
+                print(f'rebuild data: {sh.info}')
+                sh.write_data(writer, True)
+                written_sheets.append(sh)
+
+        for sh in sheets:
+            if sh not in written_sheets:
+                print(f'new data: {sh.info}')
+                sh.write_data(writer, True)
+
+
+def get_template(filename):
+    # watch模式下重复使用编译好的模板
+    mtime = os.stat(filename).st_mtime_ns
+    cache_key = (filename, mtime)
+    if cache_key not in _template_cache:
+        _template_cache[cache_key] = Template(filename=filename)
+
+    return _template_cache[cache_key]
 
 
 def write_code(all_code, code_fold, language):
@@ -147,7 +587,7 @@ def write_code(all_code, code_fold, language):
         if basename == "CSCfgVersion.h":
             continue
 
-        engine = Template(filename=template)
+        engine = get_template(template)
         content = engine.render(all=all_code)
         filepath = os.path.join(code_fold, basename)
         with open(filepath, 'wb') as ofp:
@@ -160,22 +600,33 @@ def write_code_version(code_fold, git_version, language):
         return
 
     filepath = os.path.join(code_fold, 'CSCfgVersion.h')
-    engine = Template(filename=version_file)
+    engine = get_template(version_file)
     with open(filepath, 'wb') as ofp:
         content = engine.render(git=git_version)
         ofp.write(content.encode())
 
 
-def load_data(language, excel_dir, subdir, define_file, test_data, namespace):
+def load_language(language, reload=False):
     print('/> load language config ...')
     filepath = os.path.join(cwd, 'templates', f'{language}.yml')
-    sign_map = load_sign_map(filepath)
+    sign_map = load_sign_map(filepath, reload)
     if not sign_map:
         raise Exception(f'load language config error : {filepath}')
 
     print(filepath)
 
-    sheet_refs = load_excel_files(excel_dir, subdir)
+
+def reset_types(language):
+    tp.GTypeMap.reset()
+    GCodeTypeMap.clear()
+    load_language(language, True)
+
+
+def load_data(language, excel_dir, subdir, define_file, test_data, namespace, jobs=0, cache_dir=None,
+              native_xlsx=False, sheet_patterns=None):
+    load_language(language)
+
+    sheet_refs = load_excel_files(excel_dir, subdir, jobs, cache_dir, native_xlsx, sheet_patterns)
 
     print('/> start loading..')
     all_code = load_sheets(sheet_refs, define_file, test_data, namespace)
@@ -192,17 +643,50 @@ def mk_dirs(opts):
         os.makedirs(bin_dir)
 
 
-def update_excel(all_code, configs):
+def update_book(file_path, sheet_cells):
+    # sheet_cells: [(表名, [(子表名, 行, 列, 数据)])]，一个excel只加载和保存一次
+    import openpyxl as xl
+    wb = xl.load_workbook(filename=file_path)
+
+    is_modify = False
+    for sheet_name, cells in sheet_cells:
+        if sheet_name not in wb:
+            continue
+
+        for sub_sheet_name, r, c, data in cells:
+            wb[sub_sheet_name].cell(r, c, data)
+            is_modify = True
+
+    if is_modify:
+        wb.save(file_path)
+
+
+def update_excel(all_code, configs, jobs=0):
     print('> update excel')
+
+    # 修改的单元格从已经读取的表格数据中得到，按excel分组，同一个excel中的多个表一起修改
+    book_cells = {}
     for sh in all_code.sheets:
         if configs and sh.name not in configs:
             continue
 
-        sh.update_data()
+        cells = sh.get_update_data()
+        if len(cells) > 0:
+            book_cells.setdefault(sh.file_path, []).append((sh.name, cells))
+
+    files = list(book_cells.keys())
+    if jobs and jobs > 1 and len(files) > 1:
+        print(f'update excels with {jobs} jobs')
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(update_book, files, [book_cells[file] for file in files]))
+    else:
+        for file in files:
+            update_book(file, book_cells[file])
 
 
 def execute(opts):
-    mk_dirs(opts)
+    if not opts.check:
+        mk_dirs(opts)
     git_dir = opts.git_dir
     git_version = None
 
@@ -219,10 +703,52 @@ def execute(opts):
     if opts.encoding:
         tp.StringEncodingOfPack = opts.encoding
 
-    all_code = load_data(opts.language, opts.exceldir, opts.subdir, opts.define, opts.test_data, opts.namespace)
+    if opts.run_length:
+        tp.PackRunLength = True
+
+    if opts.convert_cache is not None:
+        tp.ConvertCacheSize = opts.convert_cache
+
+    if opts.numpy:
+        if numeric.is_available():
+            numeric.UseNumpy = True
+        else:
+            print('--- warning numpy is not installed, convert numeric columns one by one')
+
+    if opts.watch and not opts.update_excel and not opts.check:
+        watch(opts, git_version)
+        return
+
+    all_code = load_data(opts.language, opts.exceldir, opts.subdir, opts.define, opts.test_data, opts.namespace,
+                         opts.jobs, opts.cache, opts.native_xlsx, opts.sheets)
+
+    if opts.check:
+        check_all(all_code, opts.jobs)
+        return
 
     if opts.update_excel:
-        update_excel(all_code, opts.configs)
+        update_excel(all_code, opts.configs, opts.jobs)
+        return
+
+    write_all(all_code, opts, git_version)
+
+
+def add_writer_file(writer_files, writer_name, filepath):
+    # 多个writer写同一个文件时，和依次写入时一样，文件中是最后一个writer的数据
+    path = os.path.abspath(filepath)
+    for i, (prev_writer_name, prev_filepath) in enumerate(writer_files):
+        if os.path.abspath(prev_filepath) == path:
+            print(f'--- warning data writer {prev_writer_name} and {writer_name} write the same file {filepath}, '
+                  f'skip {prev_writer_name}')
+            del writer_files[i]
+            break
+
+    writer_files.append((writer_name, filepath))
+
+
+def write_all(all_code, opts, git_version):
+    if opts.sheets:
+        write_selected(all_code, opts, git_version)
         return
 
     print('/> writing code ...')
@@ -230,13 +756,125 @@ def execute(opts):
     write_code_version(opts.code, git_version, opts.language)
 
     print('/> writing binary ...')
+    writer_files = []
+    show_test_data = True
     for i, writer_name in enumerate(opts.writers):
         print(f'data writer name: {writer_name}')
         if i == 0:
-            write_data(all_code, opts.bin, git_version, writer_name, True)
+            if opts.incremental and writer_name == 'thrift':
+                global_hash = get_data_global_hash(all_code, opts.define, opts.test_data, opts.language)
+                write_data_incremental(all_code, opts.bin, git_version, global_hash)
+                show_test_data = False
+                continue
+
+            if opts.incremental:
+                print('--- warning incremental only support thrift writer, rebuild all data')
+            add_writer_file(writer_files, writer_name, opts.bin)
         elif writer_name in _writer_file_name:
-            file_path = os.path.join(opts.code, _writer_file_name[writer_name])
-            write_data(all_code, file_path, git_version, writer_name, False)
+            add_writer_file(writer_files, writer_name, os.path.join(opts.code, _writer_file_name[writer_name]))
+
+    if len(writer_files) > 0:
+        write_data_multi(all_code, writer_files, git_version, show_test_data, opts.jobs)
+
+    print_convert_cache_stats()
+
+
+def get_convert_cache_stats(start=(0, 0)):
+    hits, misses = tp.GTypeMap.convert_cache_stats()
+    return hits - start[0], misses - start[1]
+
+
+def add_worker_convert_cache_stats(cache_stats):
+    _worker_convert_cache_stats[0] += cache_stats[0]
+    _worker_convert_cache_stats[1] += cache_stats[1]
+
+
+def print_convert_cache_stats():
+    # 并行时大部分转换在子进程中，加上子进程返回的统计，和不并行时一样打印
+    hits, misses = get_convert_cache_stats()
+    hits += _worker_convert_cache_stats[0]
+    misses += _worker_convert_cache_stats[1]
+    _worker_convert_cache_stats[0] = _worker_convert_cache_stats[1] = 0
+    if hits or misses:
+        print(f'convert cache hit {hits}, miss {misses}')
+
+
+def write_selected(all_code, opts, git_version):
+    # 只加载了部分excel，不生成代码，只更新数据文件中选中的表
+    print('/> writing selected sheets ...')
+    for i, writer_name in enumerate(opts.writers):
+        if i == 0 and writer_name == 'thrift':
+            write_data_partial(all_code, opts.bin, git_version, opts.sheets)
+        else:
+            print(f'--- warning writer {writer_name} not support selected sheets, skip')
+
+    print_convert_cache_stats()
+
+
+def is_types_changed(changed_files, sheet_refs, define_path):
+    if define_path in changed_files:
+        return True
+
+    for sheet_ref in sheet_refs:
+        if sheet_ref and sheet_ref.file_path in changed_files and 'define' in sheet_ref.meta:
+            return True
+
+    return False
+
+
+def watch(opts, git_version):
+    define_path = os.path.join(cwd, opts.define)
+    book_cache = None
+    if opts.cache:
+        book_cache = BookCache(opts.cache)
+
+    def find_files():
+        files = find_excel_files(opts.exceldir, opts.subdir)
+        if opts.sheets:
+            files = select_sheet_files(files, opts.sheets)
+        return files
+
+    def get_watch_files():
+        return find_excel_files(opts.exceldir, opts.subdir) + [define_path, opts.test_data]
+
+    load_language(opts.language)
+
+    print('/> load excels ...')
+    files = find_files()
+    ref_map = dict(zip(files, load_file_sheet_refs(files, opts.jobs, book_cache, opts.native_xlsx, False)))
+
+    watcher = FileWatcher(get_watch_files)
+    changed_files = None
+    while True:
+        try:
+            if changed_files is not None:
+                files = find_files()
+                reload_files = [file for file in files if file in changed_files or file not in ref_map]
+
+                old_refs = [ref_map[file] for file in changed_files if file in ref_map]
+                new_refs = load_file_sheet_refs(reload_files, opts.jobs, book_cache, opts.native_xlsx, False)
+                ref_map = {file: ref_map[file] for file in files if file in ref_map and file not in reload_files}
+                ref_map.update(zip(reload_files, new_refs))
+
+                if is_types_changed(changed_files, old_refs + new_refs, define_path):
+                    print('/> reload types ...')
+                    reset_types(opts.language)
+
+            sheet_refs = [ref_map[file] for file in files if ref_map[file]]
+            if len(sheet_refs) <= 0:
+                raise Exception(f'can not find excels in dir : {opts.exceldir}')
+
+            print('/> start loading..')
+            all_code = load_sheets(sheet_refs, opts.define, opts.test_data, opts.namespace)
+            write_all(all_code, opts, git_version)
+            print('/> build finished')
+        except Exception:
+            traceback.print_exc()
+
+        print(f'/> watching {opts.exceldir} ...')
+        changed_files = watcher.wait_changes()
+        for file in sorted(changed_files):
+            print(f'changed: {file}')
 
 
 def default_opts(opts):
@@ -267,6 +905,10 @@ def default_opts(opts):
     if not opts.bin:
         opts.bin = os.path.join(opts.code, 'tables.bytes')
 
+    if opts.watch and opts.writers and opts.writers[0] == 'thrift' and not opts.incremental:
+        print('watch mode, enable incremental data')
+        opts.incremental = True
+
 
 def run(args=None):
     parser = argparse.ArgumentParser()
@@ -292,7 +934,25 @@ def run(args=None):
                         help='code language : csharp or cpp.')
 
     parser.add_argument('--cache', type=str,
-                        help='cache dir')
+                        help='cache dir, parsed excels are cached here')
+
+    parser.add_argument('--jobs', type=int, default=0,
+                        help='number of processes to load excels, write or check data and update excels, 0 or 1 to use current '
+                             'process. writing and checking data in processes needs fork, without it (windows) they '
+                             'run in the current process')
+
+    parser.add_argument('--native_xlsx', action='store_true',
+                        help='read xlsx files without xlrd, faster and use less memory')
+
+    parser.add_argument('--numpy', action='store_true',
+                        help='convert and check numeric columns with numpy')
+
+    parser.add_argument('--convert_cache', type=int,
+                        help='max cached cell values of each container type, 0 to disable, default 4096')
+
+    parser.add_argument('--run_length', action='store_true',
+                        help='pack int lists as runs when smaller: negative run count, then first, step, count '
+                             'of each run. needs BufferReader.hpp and the generated Tables.cs from this version')
 
     parser.add_argument('--git_dir', type=str,
                         help='the .git dir of config repo')
@@ -306,6 +966,19 @@ def run(args=None):
     parser.add_argument('--writers', type=str, nargs='*',
                         help='data writers')
 
+    parser.add_argument('--incremental', action='store_true',
+                        help='only rebuild data of changed excels, thrift writer only')
+
+    parser.add_argument('--watch', action='store_true',
+                        help='build, then keep rebuilding when excels or defines change')
+
+    parser.add_argument('--sheets', type=str, nargs='*',
+                        help='only build these sheets (name or glob) and the excels they depend on, '
+                             'update them in the existing data file')
+
+    parser.add_argument('--check', action='store_true',
+                        help='only convert and check data, report all errors, no code and data files are written')
+
     parser.add_argument('--update_excel', action='store_true',
                         help='write test data to excel')
                         
@@ -321,6 +994,8 @@ def run(args=None):
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
+
     in_args = [
         '--exceldir',
         'E:/configs',
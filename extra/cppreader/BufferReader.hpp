@@ -156,13 +156,13 @@ namespace GameConfig
             result += ReadByte(e);
             elemType = (TType)e;
             result += ReadInt32(sizei);
-            CheckSize(sizei);
-            size = (uint32_t)sizei;
+            result += ReadContainerSize(elemType, sizei, size);
             return result;
         }
 
         uint32_t ReadListEnd()
         {
+            ClearRunValues();
             return 0;
         }
 
@@ -174,13 +174,13 @@ namespace GameConfig
             result += ReadByte(e);
             elemType = (TType)e;
             result += ReadInt32(sizei);
-            CheckSize(sizei);
-            size = (uint32_t)sizei;
+            result += ReadContainerSize(elemType, sizei, size);
             return result;
         }
 
         uint32_t ReadSetEnd()
         {
+            ClearRunValues();
             return 0;
         }
 
@@ -192,13 +192,13 @@ namespace GameConfig
             result += ReadByte(e);
             elemType = (TType)e;
             result += ReadInt32(sizei);
-            CheckSize(sizei);
-            size = (uint32_t)sizei;
+            result += ReadContainerSize(elemType, sizei, size);
             return result;
         }
 
         uint32_t ReadArrayEnd()
         {
+            ClearRunValues();
             return 0;
         }
 
@@ -231,6 +231,13 @@ namespace GameConfig
 
         uint32_t ReadInt32(int32_t& i32)
         {
+            // 按等差段打包的整数容器，元素从展开的值中读取
+            if (run_position_ < run_values_.size())
+            {
+                i32 = run_values_[run_position_++];
+                return 0;
+            }
+
             union bytes {
                 uint8_t b[4];
                 int32_t all;
@@ -551,6 +558,13 @@ namespace GameConfig
 
         vector<int> ReadInt32List() {
             int length = ReadInt32();
+            if (length < 0)
+            {
+                vector<int>&& runs = vector<int>();
+                ReadInt32Runs(-length, runs);
+                return runs;
+            }
+
             _ASSERT(position_ + length * 4 <= length_);
             vector<int>&& val = vector<int>();
 
@@ -749,6 +763,45 @@ namespace GameConfig
             }
         }
 
+        uint32_t ReadContainerSize(TType elemType, int32_t sizei, uint32_t& size)
+        {
+            // --run_length 生成的整数容器，数量是负的段数，后面是每段的 首个值、步长、个数
+            if (sizei < 0 && elemType == T_I32)
+            {
+                uint32_t position = position_;
+                ClearRunValues();
+                ReadInt32Runs(-sizei, run_values_);
+                size = (uint32_t)run_values_.size();
+                return position_ - position;
+            }
+
+            CheckSize(sizei);
+            size = (uint32_t)sizei;
+            return 0;
+        }
+
+        void ReadInt32Runs(int32_t run_count, vector<int>& values)
+        {
+            for (int32_t i = 0; i < run_count; ++i)
+            {
+                int64_t first = ReadInt32();
+                int64_t step = ReadInt32();
+                int32_t count = ReadInt32();
+                CheckSize(count);
+                CheckSize((int32_t)(values.size() + count));
+                for (int32_t j = 0; j < count; ++j)
+                {
+                    values.push_back((int)(first + step * j));
+                }
+            }
+        }
+
+        void ClearRunValues()
+        {
+            run_values_.clear();
+            run_position_ = 0;
+        }
+
         void ReadAll(uint8_t* buffer, int32_t size)
         {
             _ASSERT(position_ + size <= length_);
@@ -786,6 +839,8 @@ namespace GameConfig
         uint32_t length_;
         uint32_t position_;
         uint32_t recursion_depth_ = 0;
+        vector<int> run_values_;
+        size_t run_position_ = 0;
     };
 
     class RecursionTracker
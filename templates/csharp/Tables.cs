@@ -94,6 +94,36 @@ namespace Generated
             % endfor
         }
 
+        private static List<int> ReadInt32List(BufferHelper helper)
+        {
+            var count = helper.ReadInt32();
+            if (count >= 0)
+            {
+                var values = new List<int>(count);
+                for (var i = 0; i < count; ++i)
+                {
+                    values.Add(helper.ReadInt32());
+                }
+
+                return values;
+            }
+
+            // --run_length: count is the negative number of runs, each run is first, step, count
+            var runs = new List<int>();
+            for (var i = 0; i < -count; ++i)
+            {
+                long first = helper.ReadInt32();
+                long step = helper.ReadInt32();
+                var runCount = helper.ReadInt32();
+                for (var j = 0; j < runCount; ++j)
+                {
+                    runs.Add((int)(first + step * j));
+                }
+            }
+
+            return runs;
+        }
+
 
         % for sheet in all.singles:
         % if len(sheet.sub_sheets) <= 1:
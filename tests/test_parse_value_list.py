@@ -0,0 +1,135 @@
+#! python 3
+# -*- coding: utf_8 -*-
+
+import random
+
+import pytest
+
+from core.utils import parse_value_list
+
+
+def _is_split_char(c, split_char):
+    if split_char == ',':
+        return c == split_char or c == '，'
+    else:
+        return c == split_char
+
+
+def _baseline_parse_value_list(value_str, split_char=','):
+    # 改为str.split和正则之前的实现，逐个字符扫描，作为对比的标准结果
+    assert isinstance(value_str, str)
+
+    value_str = value_str.strip()
+    value_list = []
+    start = 0
+    end = -1
+    if value_str == '':
+        return value_list
+
+    if value_str[start] == '(' and value_str[end] == ')':
+        start = 1
+        value = value_str[start:end]
+        value_list.append(value.strip())
+        return value_list
+
+    if value_str[start] == '{' and value_str[end] == '}':
+        start = 1
+    elif value_str[start] == '[' and value_str[end] == ']':
+        start = 1
+
+    if start > 0:
+        value_str = value_str[start:end]
+    i = 0
+    l = len(value_str)
+    prev = 0
+    escape_map = {'{': '}', '[': ']', '(': ')', '\'': '\'', '"': '"'}
+    escape_chars = []
+    cur_escape_char = None
+    while i < l:
+        is_escaped = (i < l and value_str[i - 1] == '\\')
+        if is_escaped:
+            i += 1
+            continue
+
+        c = value_str[i]
+        if c in '{[("\'':
+            if cur_escape_char:
+                escape_chars.append(cur_escape_char)
+            cur_escape_char = c
+            i += 1
+            continue
+
+        if cur_escape_char and c == escape_map[cur_escape_char]:
+            if len(escape_chars) == 0:
+                cur_escape_char = None
+            else:
+                cur_escape_char = escape_chars.pop()
+            i += 1
+            if i == l:
+                value = value_str[prev:]
+                value_list.append(value.strip())
+            continue
+
+        if not cur_escape_char and (_is_split_char(c, split_char) or i + 1 == l):
+            if i + 1 == l:
+                value = value_str[prev:]
+            else:
+                value = value_str[prev:i]
+            value_list.append(value.strip())
+            prev = i + 1
+
+        i += 1
+
+    return value_list
+
+
+# 配置表中常见的单元格
+_real_cells = [
+    '', ' ', '1', '0.5', 'item1', 'Weapon',
+    '1,2,3', '309,62', '9997,9611,5446,3769,8634,6169,7247,753,2929,5102',
+    '0.135,0.952,0.940,0.302,0.738,0.891', ' 1 , 2 ,3 ', '1,,2', '1,2,', ',1',
+    '1，2，3', '1，2,3', '甲，乙，丙', '名字,描述',
+    '(4)', '(1,2)', '( 1 , 2 )', '[5,6]', '[ 5 , 6 ]', '{1,2}', '[]', '{}', '()',
+    '[{1,2},{3,4}]', '[{198,26},{974,55},{835,16}]', '[{460,99}]', '{[1,2],[3,4]}',
+    '[{1,[2,3]},{4,(5,6)}]', '{{1,2},{3,{4,5}}}', '[1,2', '1,2]', '{1,2]', '[{1,2}', '{1,2},{3,4}',
+    '1:2,3:4', '0:747,1:668,2:442,3:373,4:573,5:274', '1:{2,3},4:{5,6}', 'a:b:c',
+    '11<45000-45010>33', '1<1-5>', '<1-3>', '10<1-3>,20',
+    '"a,b",c', "'a,b',c", '"a,b"', '"a"b",c', "it's,fine", '"unclosed,1,2', "'x',\"y\"",
+    '{"a,b",c}', '["a,[b",c]', '\\,1,2', '1\\,2,3', 'a\\\\,b', '\\"1,2', '1,2\\',
+    'SSNextSkillEffect;1;2', '1;2;3', '1::2::3', 'a)b)c',
+]
+
+_split_chars = [',', ';', ':', '::', ')']
+
+
+def _random_cells(count, seed):
+    rnd = random.Random(seed)
+    alphabet = list('ab1 ,，;:{}[]()"\'\\<->')
+    return [''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 12))) for _ in range(count)]
+
+
+def _parse(parse, value_str, split_char):
+    try:
+        return parse(value_str, split_char)
+    except Exception as e:
+        return type(e)
+
+
+@pytest.mark.parametrize('split_char', _split_chars)
+@pytest.mark.parametrize('value_str', _real_cells)
+def test_real_cells(value_str, split_char):
+    assert _parse(parse_value_list, value_str, split_char) == \
+        _parse(_baseline_parse_value_list, value_str, split_char)
+
+
+@pytest.mark.parametrize('split_char', _split_chars)
+def test_random_cells(split_char):
+    for value_str in _random_cells(20000, 1):
+        assert _parse(parse_value_list, value_str, split_char) == \
+            _parse(_baseline_parse_value_list, value_str, split_char), value_str
+
+
+def test_default_split_char():
+    assert parse_value_list('1，2,3') == ['1', '2', '3']
+    assert parse_value_list('[{1,2},{3,4}]') == ['{1,2}', '{3,4}']
+    assert parse_value_list('(1,2)') == ['1,2']